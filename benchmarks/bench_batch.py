@@ -0,0 +1,41 @@
+"""
+Per-row add_entry vs batched add_entries.
+
+    python -m benchmarks.bench_batch [N]
+"""
+import sys
+
+from scripts.database import DatabaseHandler
+from .common import (
+    temporary_database,
+    timed,
+    random_entries,
+)
+
+
+def per_row(db_file, entries):
+    db_handler = DatabaseHandler(db_file)
+    for entry in entries:
+        db_handler.add_entry(**entry)
+    db_handler.close_connection()
+
+
+def batched(db_file, entries):
+    db_handler = DatabaseHandler(db_file)
+    db_handler.add_entries(entries)
+    db_handler.close_connection()
+
+
+def main(n: int = 10000):
+    entries = random_entries(n)
+    results = {}
+    for name, function in (("add_entry", per_row), ("add_entries", batched)):
+        with temporary_database() as db_file:
+            results[name] = timed(function, db_file, entries)
+        print(f"{name:12s} {n} rows: {results[name]:.3f}s ({n/results[name]:.0f} rows/s)")
+    print(f"speed-up: {results['add_entry']/results['add_entries']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,74 @@
+"""
+Per-refresh cost of the summary charts: clear-and-rebuild (the previous
+implementation) vs CategoryBarChart.update, both rendered offscreen with Agg.
+
+    python -m benchmarks.bench_charts [N_REFRESHES]
+"""
+import sys
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from scripts.charts import CategoryBarChart
+from scripts.utils import CATEGORIES_AVAILABLE
+
+
+def random_summaries(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [(rng.uniform(0, 800, len(CATEGORIES_AVAILABLE)), rng.uniform(0, 200, len(CATEGORIES_AVAILABLE)))
+            for _ in range(n)]
+
+
+def new_figure():
+    figure = Figure(figsize=(6, 4), dpi=100)
+    figure.set_tight_layout(True)
+    return figure, FigureCanvasAgg(figure)
+
+
+def rebuild(figure, canvas, means, stds):
+    # What plotSummaryAllMonths used to do on every refresh
+    figure.clear()
+    ax = figure.add_subplot(111)
+    ax.bar(CATEGORIES_AVAILABLE, means, color='#5688e5')
+    ax.errorbar(range(len(CATEGORIES_AVAILABLE)), means, yerr=stds, fmt='.', color='black', capsize=2, alpha=0.3)
+    for category, value, std in zip(CATEGORIES_AVAILABLE, means, stds):
+        ax.text(category, value+std + 75, "{:.2f}€".format(value), ha='center', va='bottom')
+        ax.text(category, value+std + 0.5, "(±{:d}€)".format(int(std)), ha='center', va='bottom', fontsize=7)
+    ax.set_title("Average of expenses [Total: {:.2f}€]".format(sum(means)), loc='right')
+    ax.set_ylim(top=1.25*max(means + stds))
+    canvas.draw()
+
+
+def run_rebuild(summaries):
+    figure, canvas = new_figure()
+    start = time.perf_counter()
+    for means, stds in summaries:
+        rebuild(figure, canvas, means, stds)
+    return (time.perf_counter() - start)/len(summaries)
+
+
+def run_update(summaries):
+    figure, canvas = new_figure()
+    chart = CategoryBarChart(figure, with_errors=True)
+    start = time.perf_counter()
+    for means, stds in summaries:
+        chart.update(means, stds, title="Average of expenses [Total: {:.2f}€]".format(sum(means)))
+        canvas.draw()
+    return (time.perf_counter() - start)/len(summaries)
+
+
+def main(n: int = 50):
+    summaries = random_summaries(n)
+    results = {"rebuild": run_rebuild(summaries), "update": run_update(summaries)}
+    for name, per_refresh in results.items():
+        print(f"{name:8s} {1000*per_refresh:.1f} ms per refresh")
+    print(f"speed-up: {results['rebuild']/results['update']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
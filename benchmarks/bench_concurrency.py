@@ -0,0 +1,105 @@
+"""
+Concurrent readers and writers on the same database file, like the UI and
+the bot running at the same time.
+
+    python -m benchmarks.bench_concurrency [WRITERS] [READERS] [ROWS_PER_WRITER]
+
+Writers are separate processes adding expenses one transaction at a time
+(the worst case, as add_entry does), readers loop over the UI queries
+until every writer is done. At the end every written row must be in the
+database and the monthly rollup must agree with it; the exit code is 1
+otherwise.
+"""
+import multiprocessing
+import sys
+import time
+
+from scripts.database import DatabaseHandler
+from .common import (
+    temporary_database,
+    random_entries,
+)
+
+
+def writer(db_file: str, index: int, n: int, results):
+    db_handler = DatabaseHandler(db_file)
+    errors = 0
+    max_latency = 0.0
+    start = time.perf_counter()
+    for i, entry in enumerate(random_entries(n, seed=index)):
+        entry["description"] = f"writer {index} row {i}"
+        call_start = time.perf_counter()
+        try:
+            db_handler.add_entry(**entry)
+        except Exception as e:
+            print(f"writer {index}: {e}")
+            errors += 1
+        max_latency = max(max_latency, time.perf_counter() - call_start)
+    results.put(("writer", index, n - errors, time.perf_counter() - start, max_latency))
+    db_handler.close_connection()
+
+
+def reader(db_file: str, index: int, done, results):
+    db_handler = DatabaseHandler(db_file)
+    queries = 0
+    errors = 0
+    max_latency = 0.0
+    start = time.perf_counter()
+    while not done.is_set():
+        call_start = time.perf_counter()
+        try:
+            db_handler.get_change_token()
+            db_handler.get_elements_period("June", "2024")
+            db_handler.get_totals_period("June", "2024")
+        except Exception as e:
+            print(f"reader {index}: {e}")
+            errors += 1
+        max_latency = max(max_latency, time.perf_counter() - call_start)
+        queries += 1
+    results.put(("reader", index, queries - errors, time.perf_counter() - start, max_latency))
+    db_handler.close_connection()
+
+
+def check(db_file: str, writers: int, n: int):
+    # (missing rows, rollup consistent)
+    db_handler = DatabaseHandler(db_file)
+    cursor = db_handler.cursor
+    written = cursor.execute("SELECT COUNT(*) FROM expenses WHERE description LIKE 'writer %'").fetchone()[0]
+    rollup = cursor.execute('SELECT SUM(count), SUM(total_cents) FROM monthly_totals').fetchone()
+    ledger = cursor.execute('SELECT COUNT(*), SUM(value_cents) FROM expenses').fetchone()
+    db_handler.close_connection()
+    return writers*n - written, tuple(rollup) == tuple(ledger)
+
+
+def main(writers: int = 2, readers: int = 2, n: int = 500):
+    with temporary_database() as db_file:
+        DatabaseHandler(db_file).close_connection() # Create and migrate once, before the race
+        results = multiprocessing.Queue()
+        done = multiprocessing.Event()
+        reader_processes = [multiprocessing.Process(target=reader, args=(db_file, i, done, results)) for i in range(readers)]
+        writer_processes = [multiprocessing.Process(target=writer, args=(db_file, i, n, results)) for i in range(writers)]
+        for process in reader_processes + writer_processes:
+            process.start()
+        for process in writer_processes:
+            process.join()
+        done.set()
+        for process in reader_processes:
+            process.join()
+
+        totals = {"writer": [0, 0.0], "reader": [0, 0.0]}
+        for _ in range(writers + readers):
+            kind, index, count, elapsed, max_latency = results.get()
+            totals[kind][0] += count
+            totals[kind][1] = max(totals[kind][1], elapsed)
+            print(f"{kind} {index}: {count} ok in {elapsed:.2f}s ({count/elapsed:.0f}/s), max latency {max_latency*1000:.1f} ms")
+        print(f"writes: {totals['writer'][0]} ({totals['writer'][0]/totals['writer'][1]:.0f}/s overall)")
+        print(f"reads:  {totals['reader'][0]} ({totals['reader'][0]/totals['reader'][1]:.0f}/s overall)")
+
+        missing, consistent = check(db_file, writers, n)
+        print(f"lost writes: {missing}, rollup consistent: {consistent}")
+        return missing == 0 and consistent
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    sys.exit(0 if main(*args) else 1)
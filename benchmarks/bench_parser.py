@@ -0,0 +1,43 @@
+"""
+UserInputProcessor (one object per line) vs parse_batch (columnar).
+
+    python -m benchmarks.bench_parser [N]
+"""
+import random
+import sys
+
+from scripts.processInput import (
+    UserInputProcessor,
+    parse_batch,
+)
+from scripts.utils import CATEGORIES_AVAILABLE
+from .common import timed
+
+
+def random_lines(n: int, seed: int = 0):
+    # Bot-style queries, roughly 10% of them invalid
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        value = f"{rng.randint(1, 5000)/100:.2f}" if rng.random() > 0.1 else "abc"
+        lines.append(f"{rng.randint(1, 28):02}/{rng.randint(1, 12):02}/{rng.randint(2024, 2026)}; "
+                     f"{value}; {rng.choice(CATEGORIES_AVAILABLE)}; expense {i}")
+    return lines
+
+
+def per_object(lines):
+    return [UserInputProcessor(line).isValid for line in lines]
+
+
+def main(n: int = 100000):
+    lines = random_lines(n)
+    results = {}
+    for name, function in (("UserInputProcessor", per_object), ("parse_batch", parse_batch)):
+        results[name] = timed(function, lines, repeat=3)
+        print(f"{name:20s} {n} lines: {results[name]:.3f}s ({n/results[name]:.0f} lines/s)")
+    print(f"speed-up: {results['UserInputProcessor']/results['parse_batch']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,90 @@
+"""
+Exercise the reply rate limiter against a local fake Bot API server.
+
+    python -m benchmarks.bench_sender [N_MESSAGES] [RATE]
+
+The fake server answers sendMessage like Telegram does, and replies
+"429 retry after 1" to every 10th request. The printed request rate
+should stay at or under RATE, and every message should arrive once.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from telegram import Bot
+
+from scripts.messageSender import MessageSender
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    requests = [] # (timestamp, text) of every accepted sendMessage
+    calls = 0
+    flood_every = 10
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            data = json.loads(raw) if raw else {}
+        else: # python-telegram-bot posts url-encoded forms
+            data = dict(parse_qsl(raw))
+        method = self.path.rsplit('/', 1)[-1]
+        if method == "getMe": # Called by `async with bot` (Bot.initialize)
+            self.reply(200, {"ok": True, "result": {"id": 123, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}})
+            return
+        if method != "sendMessage":
+            self.reply(200, {"ok": True, "result": True})
+            return
+        FakeBotAPI.calls += 1
+        if FakeBotAPI.calls % FakeBotAPI.flood_every == 0:
+            self.reply(429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}})
+            return
+        FakeBotAPI.requests.append((time.monotonic(), data.get("text")))
+        self.reply(200, {"ok": True, "result": {
+            "message_id": len(FakeBotAPI.requests), "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 1)), "type": "private"}, "text": data.get("text", ""),
+        }})
+
+
+async def send(port: int, n: int, rate: float):
+    bot = Bot("123:fake", base_url=f"http://127.0.0.1:{port}/bot")
+    sender = MessageSender(bot, rate=rate, burst=3)
+    async with bot:
+        start = time.monotonic()
+        await sender.send_all(1, [f"message {i}" for i in range(n)])
+        elapsed = time.monotonic() - start
+    return sender, elapsed
+
+
+def main(n: int = 30, rate: float = 5.0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sender, elapsed = asyncio.run(send(server.server_address[1], n, rate))
+    finally:
+        server.shutdown()
+
+    texts = [text for _, text in FakeBotAPI.requests]
+    print(f"{sender.sent} sent, {sender.retried} retried after 429, {elapsed:.2f}s")
+    print(f"effective rate: {len(texts)/elapsed:.2f} msg/s (limit {rate} msg/s, burst 3)")
+    print("all delivered once, in order:", texts == [f"message {i}" for i in range(n)])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30, float(sys.argv[2]) if len(sys.argv) > 2 else 5.0)
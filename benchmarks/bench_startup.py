@@ -0,0 +1,56 @@
+"""
+Import-time cost of each entry point, measured with `python -X importtime`
+in fresh interpreters.
+
+    python -m benchmarks.bench_startup
+
+"eager" is what every method paid before main.py imported lazily: the UI
+and the bot modules together.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+ENTRY_POINTS = {
+    "eager (old main.py)": "import scripts.UI, scripts.telegramBot",
+    "ui": "import scripts.UI",
+    "bot": "import scripts.telegramBot",
+    "import": "import scripts.importStatement",
+    "report": "import scripts.report",
+    "rebuild": "import scripts.database",
+}
+
+
+def import_time(statement: str):
+    # Total cumulative import time (us) of the top-level imports of `statement`
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split('|')
+        if not name[1:].startswith(' '): # Nested imports are indented
+            total += int(cumulative)
+    return total
+
+
+def main(repeat: int = 5):
+    results = {}
+    for name, statement in ENTRY_POINTS.items():
+        times = [import_time(statement) for _ in range(repeat)]
+        if None in times:
+            print(f"{name:20s} unavailable (missing dependency)")
+            continue
+        results[name] = statistics.median(times)/1000
+        print(f"{name:20s} {results[name]:8.1f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Memory and sort time of the records behind the expenses table.
+
+    python -m benchmarks.bench_table [N]
+
+N expenses in a single month (the worst case of the expenses window) are
+turned into ExpenseRecords, then the row order is sorted by date and by
+category, as the sort buttons do. The memory reported is what the records
+add on top of the fetched rows (the description strings are shared).
+"""
+import random
+import sys
+import tracemalloc
+
+from scripts.records import (
+    records_from_rows,
+    sorted_order,
+)
+from scripts.utils import CATEGORIES_AVAILABLE
+from .common import timed
+
+
+def random_month_rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = [(i, 20240600 + rng.randint(1, 30), rng.choice(CATEGORIES_AVAILABLE), rng.randint(1, 50000), f"expense {i}")
+            for i in range(n)]
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def main(n: int = 50000):
+    rows = random_month_rows(n)
+    tracemalloc.start()
+    records = records_from_rows(rows)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    order = list(range(len(records)))
+    results = {
+        "records_mb": memory/1e6,
+        "sort_date": timed(sorted_order, records, order, "date", repeat=5),
+        "sort_category": timed(sorted_order, records, order, "category_key", repeat=5),
+    }
+    print(f"{n} records: {results['records_mb']:.1f} MB, "
+          f"sort by date {results['sort_date']*1000:.1f} ms, by category {results['sort_category']*1000:.1f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
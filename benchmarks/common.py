@@ -0,0 +1,43 @@
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+
+from scripts.utils import (
+    CATEGORIES_AVAILABLE,
+    MONTHS,
+)
+
+
+@contextmanager
+def temporary_database():
+    # Yields the path of a fresh database file, removed afterwards
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yield os.path.join(tmp_dir, "bench.db")
+
+
+def timed(function, *args, repeat: int = 1, **kwargs):
+    # Best wall time (in seconds) over `repeat` runs
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_entries(n: int, years=(2024, 2025), seed: int = 0):
+    # Entries in the add_entry keyword format
+    rng = random.Random(seed)
+    entries = []
+    for i in range(n):
+        entries.append({
+            "month": rng.choice(MONTHS),
+            "year": rng.randint(*years),
+            "day": f"{rng.randint(1, 28):02}",
+            "category": rng.choice(CATEGORIES_AVAILABLE),
+            "value": f"{rng.randint(1, 50000)/100:.2f}",
+            "description": f"expense {i}",
+        })
+    return entries
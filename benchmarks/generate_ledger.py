@@ -0,0 +1,58 @@
+"""
+Seeded synthetic ledgers for the benchmarks.
+
+    python -m benchmarks.generate_ledger N OUTPUT.db [--seed S] [--first-year Y] [--last-year Y]
+
+The same (N, seed, years) always produces the same database.
+"""
+import os
+import random
+from argparse import ArgumentParser
+
+from scripts.database import DatabaseHandler
+from scripts.utils import CATEGORIES_AVAILABLE
+
+# Rough shape of a real ledger: many small food/leisure expenses, few big home ones
+CATEGORY_WEIGHTS = [5, 30, 20, 10, 5, 5, 25]
+CATEGORY_MEAN_CENTS = [40000, 1500, 3000, 5000, 20000, 10000, 2500]
+DESCRIPTIONS = ["supermarket", "restaurant", "cinema", "rent", "train ticket", "books", "coffee", "pharmacy",
+                "gym", "electricity", "concert", "flight", "course", "gift", "bakery", "internet"]
+
+
+def generate_records(n: int, seed: int = 0, first_year: int = 2024, last_year: int = 2030):
+    # Yields (YYYYMMDD, category, value_cents, description) tuples
+    rng = random.Random(seed)
+    categories = list(range(len(CATEGORIES_AVAILABLE)))
+    for i in range(n):
+        category = rng.choices(categories, CATEGORY_WEIGHTS)[0]
+        date = rng.randint(first_year, last_year)*10000 + rng.randint(1, 12)*100 + rng.randint(1, 28)
+        cents = max(1, int(rng.expovariate(1/CATEGORY_MEAN_CENTS[category])))
+        description = f"{rng.choice(DESCRIPTIONS)} {rng.choice(DESCRIPTIONS)} #{i}"
+        yield (date, CATEGORIES_AVAILABLE[category], cents, description)
+
+
+def generate_ledger(n: int, db_file: str, seed: int = 0, first_year: int = 2024, last_year: int = 2030,
+                    chunk_size: int = 50000):
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    db_handler = DatabaseHandler(db_file)
+    chunk = []
+    for record in generate_records(n, seed, first_year, last_year):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            db_handler.add_records(chunk)
+            chunk = []
+    db_handler.add_records(chunk)
+    db_handler.close_connection()
+    return db_file
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("n", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--first-year", type=int, default=2024)
+    parser.add_argument("--last-year", type=int, default=2030)
+    args = parser.parse_args()
+    generate_ledger(args.n, args.output, args.seed, args.first_year, args.last_year)
@@ -0,0 +1,145 @@
+"""
+Benchmark suite over synthetic ledgers of growing size.
+
+    python -m benchmarks.run [--sizes 10000 100000 1000000] [--output results.json]
+    python -m benchmarks.run --compare before.json after.json
+
+Ledgers are generated once (seeded) into benchmarks/data/ and reused; the
+write benchmarks run on a temporary copy, so the cached ledgers never change.
+Results are best-of-N wall times in seconds, written as JSON together with
+the git commit, so runs of different commits can be compared.
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+from argparse import ArgumentParser
+
+from scripts.database import DatabaseHandler
+from scripts.processInput import parse_batch
+from .bench_parser import random_lines
+from .common import temporary_database, timed
+from .generate_ledger import generate_ledger
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def ledger_file(n: int, seed: int):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db_file = os.path.join(DATA_DIR, f"ledger_{n}_{seed}.db")
+    if not os.path.isfile(db_file):
+        start = time.perf_counter()
+        generate_ledger(n, db_file, seed)
+        print(f"generated {db_file} in {time.perf_counter() - start:.1f}s")
+    return db_file
+
+
+def copy_database(db_file: str, copy_file: str):
+    # The backup API also copies what is still in the WAL of the source
+    with sqlite3.connect(db_file) as source, sqlite3.connect(copy_file) as copy:
+        source.backup(copy)
+    source.close()
+    copy.close()
+
+
+def bench_database(db_file: str, repeat: int):
+    # The writes go to a copy, so the cached ledger stays the same from one run to the next
+    with temporary_database() as copy_file:
+        copy_database(db_file, copy_file)
+        db_handler = DatabaseHandler(copy_file)
+        results = {
+            "get_elements_period": timed(db_handler.get_elements_period, "June", "2027", repeat=repeat),
+            "get_cumulative_expenses_until_period": timed(db_handler.get_cumulative_expenses_until_period,
+                                                          "December", "2030", repeat=repeat),
+        }
+        entry = dict(month="June", year="2027", day="15", category="Food", value="12.34", description="benchmark entry")
+        # Matched pairs: every delete removes the entry added just before, never a no-op lookup
+        results["add_entry"] = results["delete_entry"] = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db_handler.add_entry(**entry)
+            added = time.perf_counter()
+            if not db_handler.delete_entry(**entry):
+                raise RuntimeError("delete_entry didn't find the entry just added")
+            results["add_entry"] = min(results["add_entry"], added - start)
+            results["delete_entry"] = min(results["delete_entry"], time.perf_counter() - added)
+        db_handler.close_connection()
+    return results
+
+
+def bench_parser(n: int, repeat: int):
+    lines = random_lines(n)
+    return {"parse_batch_per_line": timed(parse_batch, lines, repeat=repeat)/n}
+
+
+def bench_charts(repeat: int):
+    try:
+        from .bench_charts import random_summaries, run_update
+    except ImportError: # matplotlib/numpy not installed
+        return {}
+    return {"chart_refresh": min(run_update(random_summaries(10)) for _ in range(repeat))}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(before_file: str, after_file: str):
+    with open(before_file) as f:
+        before = json.load(f)
+    with open(after_file) as f:
+        after = json.load(f)
+    print(f"{'':45s} {before['commit']:>10s} {after['commit']:>10s}   ratio")
+    for size, results in after["results"].items():
+        for name, value in results.items():
+            old = before["results"].get(size, {}).get(name)
+            if old is None:
+                continue
+            print(f"{size + ' ' + name:45s} {old:10.6f} {value:10.6f}   {old/value:5.2f}x")
+
+
+def main(sizes, seed: int = 0, repeat: int = 5, output: str = None):
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": {},
+    }
+    for n in sizes:
+        db_file = ledger_file(n, seed)
+        report["results"][str(n)] = bench_database(db_file, repeat)
+        print(f"{n} expenses: " + ", ".join(f"{k}={v*1000:.4g}ms" for k, v in report["results"][str(n)].items()))
+    report["results"]["parser"] = bench_parser(100000, repeat)
+    report["results"]["charts"] = bench_charts(repeat)
+    for name in ("parser", "charts"):
+        print(f"{name}: " + ", ".join(f"{k}={v*1000:.4g}ms" for k, v in report["results"][name].items()))
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), default=None)
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        main(args.sizes, args.seed, args.repeat, args.output)
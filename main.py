@@ -1,7 +1,7 @@
+import sys
 from argparse import ArgumentParser
 
-from scripts.UI import mainUI
-from scripts.telegramBot import mainBot
+# Each method imports only what it needs: the bot and the CLI methods never pay for PyQt5/matplotlib.
 
 def get_parser():
     parser = ArgumentParser()
@@ -9,6 +9,57 @@ def get_parser():
         "--method",
         default="ui"
     )
+    parser.add_argument(
+        "file",
+        nargs="?",
+        help="File to import ('--method import') or export/report to ('--method export'/'report', default stdout)"
+    )
+    parser.add_argument(
+        "--columns",
+        default="date=0,value=1,category=2,description=3",
+        help="Column mapping of the imported file: field=<header name or 0-based index>"
+    )
+    parser.add_argument(
+        "--delimiter",
+        default=","
+    )
+    parser.add_argument(
+        "--header",
+        action="store_true",
+        help="The imported file starts with a header line"
+    )
+    parser.add_argument(
+        "--default-category",
+        default=None,
+        help="Category used for imported rows without one"
+    )
+    parser.add_argument(
+        "--from",
+        dest="date_from",
+        default=None,
+        help="First day (YYYY-MM-DD) of the range, included"
+    )
+    parser.add_argument(
+        "--to",
+        dest="date_to",
+        default=None,
+        help="Last day (YYYY-MM-DD) of the range, excluded"
+    )
+    parser.add_argument(
+        "--category",
+        default=None
+    )
+    parser.add_argument(
+        "--by",
+        default="month",
+        help="Rows of the report ('--method report'): month, year or category"
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        default="table",
+        help="Output of the report ('--method report'): table, json or csv"
+    )
     return parser
 
 
@@ -16,13 +67,41 @@ if __name__ == '__main__':
     
     args = get_parser().parse_args()
     method = args.method.lower()
+    success = True # The CLI methods return False on a usage error
     
     if method == "ui":
+        from scripts.UI import mainUI
         mainUI()
     elif method == "bot":
         import asyncio
+        from scripts.telegramBot import mainBot
         asyncio.run(mainBot())
+    elif method == "botd":
+        import asyncio
+        from scripts.telegramBot import mainBotDaemon
+        asyncio.run(mainBotDaemon())
+    elif method == "import":
+        from scripts.importStatement import mainImport
+        success = mainImport(args.file, columns=args.columns, delimiter=args.delimiter, header=args.header,
+                             default_category=args.default_category)
+    elif method == "export":
+        from scripts.exportStatement import mainExport
+        success = mainExport(args.file, args.date_from, args.date_to, category=args.category, delimiter=args.delimiter)
+    elif method == "report":
+        from scripts.report import mainReport
+        success = mainReport(args.file, args.date_from, args.date_to, by=args.by, category=args.category,
+                             output_format=args.output_format)
+    elif method == "charts":
+        from scripts.rendering import mainCharts
+        success = mainCharts(args.date_from, args.date_to)
+    elif method == "rebuild":
+        from scripts.database import DatabaseHandler
+        db_handler = DatabaseHandler()
+        db_handler.rebuild_monthly_totals()
+        db_handler.close_connection()
+        print("Monthly totals rebuilt.")
     else:
-        import sys
-        print("Please provide running method: 'ui' or 'bot'")
-        sys.exit()
\ No newline at end of file
+        print("Please provide running method: 'ui', 'bot', 'botd', 'import', 'export', 'report', 'charts' or 'rebuild'")
+        sys.exit()
+    if not success:
+        sys.exit(1)
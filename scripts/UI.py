@@ -1,10 +1,9 @@
 import sys
 import time
-import numpy as np
 
-from PyQt5.QtCore import QTimer, pyqtSignal, QPoint
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLineEdit, QPushButton, QComboBox, QLabel, QListWidget, QListWidgetItem
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QEvent, QModelIndex, QAbstractTableModel
+from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLineEdit, QPushButton, QComboBox, QLabel, QTableView, QHeaderView, QStyledItemDelegate, QStyleOptionButton, QStyle
+from PyQt5.QtGui import QFont, QColor, QPalette
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
@@ -13,7 +12,6 @@ import matplotlib.pyplot as plt
 from .utils import(
     FONT,
     CATEGORIES_AVAILABLE,
-    YEARS,
     MONTHS,
     DICT_MONTHS_NAMETONUMBER,
 )
@@ -24,12 +22,147 @@ from .database import(
 from .processInput import(
     UserInputProcessor
 )
+from .instrumentation import(
+    instrumented,
+)
+from .charts import(
+    CategoryBarChart,
+)
+from .records import(
+    records_from_rows,
+    sorted_order,
+)
+from .workers import(
+    QueryWorker,
+    records_period,
+    summary_date,
+    summary_all_months,
+)
 
 plt.rcParams.update({
         "font.family": FONT,
         "font.size": 9,
 })
 
+class ChangeGate:
+    """
+    Decides whether a periodic refresh has anything new to show, comparing
+    the database change token with the one of the last redraw.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.token = None
+        self.performed = 0
+        self.skipped = 0
+
+    def changed(self, token):
+        if token == self.token:
+            self.skipped += 1
+            return False
+        self.token = token
+        self.performed += 1
+        return True
+
+    def report(self):
+        print(f"{self.name}: {self.performed} refreshes performed, {self.skipped} skipped")
+
+
+class ExpensesTableModel(QAbstractTableModel):
+    """
+    Table model over the ExpenseRecords of a month. The view only asks for the cells
+    it is painting, so only visible rows are ever formatted. Row `r` shows
+    `records[order[r]]`: sorting and deleting only touch the `order` list of indexes.
+    """
+    HEADERS = ["Day", "Category", "Value", "Description", ""]
+    SORT_KEYS = ["date", "category_key", "value_cents", "description"]
+    DELETE_COLUMN = 4
+
+    def __init__(self, records, parent=None):
+        super().__init__(parent)
+        self.records = list(records)
+        self.order = list(range(len(self.records)))
+
+    def set_records(self, records):
+        self.beginResetModel()
+        self.records = list(records)
+        self.order = list(range(len(self.records)))
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def format_date(self, record):
+        return record.day()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        column = index.column()
+        if column == self.DELETE_COLUMN:
+            return "Delete"
+        record = self.records[self.order[index.row()]]
+        if column == 0:
+            return self.format_date(record)
+        if column == 1:
+            return record.category
+        if column == 2:
+            return record.value()
+        return record.description
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= len(self.SORT_KEYS):
+            return
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        self.order = sorted_order(self.records, old_order, self.SORT_KEYS[column], reverse=order == Qt.DescendingOrder)
+        persistent = self.persistentIndexList()
+        if persistent:
+            rows = {record: row for row, record in enumerate(self.order)}
+            self.changePersistentIndexList(persistent, [self.index(rows[old_order[index.row()]], index.column())
+                                                        for index in persistent])
+        self.layoutChanged.emit()
+
+    def expense_id(self, row):
+        return self.records[self.order[row]].id
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        record = self.records[self.order.pop(row)] # The record itself stays in `records`, unreferenced by `order`
+        self.endRemoveRows()
+        return record
+
+
+class DeleteButtonDelegate(QStyledItemDelegate):
+    """
+    Paints a push button in the cell and reports clicks, instead of
+    creating a real QPushButton for every row.
+    """
+    deleteClicked = pyqtSignal(QModelIndex)
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(4, 4, -4, -4)
+        button.text = index.data(Qt.DisplayRole)
+        button.state = QStyle.State_Enabled
+        button.palette = option.palette
+        button.palette.setColor(QPalette.ButtonText, QColor("red"))
+        QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.deleteClicked.emit(index)
+            return True
+        return super().editorEvent(event, model, option, index)
+
+
 class ExpensesWindow(QMainWindow):
     def __init__(self, db_handler, month, year):
         super().__init__()
@@ -37,7 +170,6 @@ class ExpensesWindow(QMainWindow):
         self.db_handler = db_handler
         self.month = month
         self.year = year
-        self.items = self.db_handler.get_elements_period(self.month, self.year)
         
         self.setWindowTitle(f"Expenses of {self.month} {self.year}")
         self.setGeometry(550, 300, 800, 400)
@@ -69,97 +201,123 @@ class ExpensesWindow(QMainWindow):
         self.h_layout.addWidget(sort_category_label)
         self.h_layout.addStretch() # align to the left
     
-        self.list_widget = QListWidget()
+        """
+        Table of expenses: the model sorts itself, no proxy in between
+        """
+        self.model = ExpensesTableModel([], self)
+        
+        self.table_view = QTableView()
+        self.table_view.setModel(self.model)
+        self.table_view.setSelectionMode(QTableView.NoSelection)
+        self.table_view.setEditTriggers(QTableView.NoEditTriggers)
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.verticalHeader().setDefaultSectionSize(40)
+        self.table_view.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
+        self.table_view.setColumnWidth(0, 50)
+        self.table_view.setColumnWidth(1, 120)
+        self.table_view.setColumnWidth(2, 90)
+        self.table_view.setColumnWidth(ExpensesTableModel.DELETE_COLUMN, 100)
+        self.delete_delegate = DeleteButtonDelegate(self.table_view)
+        self.delete_delegate.deleteClicked.connect(self.delete_item)
+        self.table_view.setItemDelegateForColumn(ExpensesTableModel.DELETE_COLUMN, self.delete_delegate)
         self.sorting_type = "date"
-        self.write_expenses_window()
+        self.sort_items(self.sorting_type)
+
+        self.items_worker = QueryWorker(self.db_handler.db_file, self)
+        self.items_worker.resultReady.connect(self.set_items)
+        self.items_worker.submit(records_period, self.month, self.year)
     
         self.layout.addLayout(self.h_layout)
-        self.layout.addWidget(self.list_widget)
+        self.layout.addWidget(self.table_view)
         self.central_widget.setLayout(self.layout)
 
     def _sort_by_date(self):
         self.sort_items("date")
         self.sort_by_category_button.setChecked(False)
-        self.write_expenses_window()
         # Keep checked
         self.sort_by_date_button.setChecked(True)
         
     def _sort_by_category(self):
         self.sort_items("category")
         self.sort_by_date_button.setChecked(False)
-        self.write_expenses_window()
         # Keep checked
         self.sort_by_category_button.setChecked(True)
 
-    def sort_items(self, method):   # Sort self.items based on button choice
+    def set_items(self, records):
+        self.model.set_records(records)
+        self.sort_items(self.sorting_type)
+
+    def sort_items(self, method):   # Reorder the rows based on button choice, the records themselves are untouched
+        self.sorting_type = method
         if method == "date":
-            self.items = sorted(self.items, key=lambda x: int(x[0]))
+            self.model.sort(0, Qt.AscendingOrder)
         elif method == "category":
-            self.items = sorted(self.items, key=lambda x: CATEGORIES_AVAILABLE.index(x[1]))
-
-    def make_printing_nice(self):
-        #Making our printing nice in the table. So everything is well separated in tabs
-        #items_print and self.items MUST have the same ordering!!
+            self.model.sort(1, Qt.AscendingOrder)
         
-        items_print = []
-        for item in self.items:
-            day, category, value, description = item
-            cols_days = 5
-            cols_category = 15
-            cols_values = 10
-            
-            line = day + " "*(cols_days-len(day))
-            line += category + " "*(cols_category-len(category))
-            line += value + " "*(cols_values-len(value))
-            line += description
-            
-            items_print.append(line)
-        return items_print
+    def delete_item(self, index):
+        row = index.row()
+        if self.db_handler.delete_entry_by_id(self.model.expense_id(row)):
+            self.model.remove_row(row)
 
 
-    def write_expenses_window(self):
-        
-        self.list_widget.clear()
-        self.items_print = self.make_printing_nice()
+class SearchResultsModel(ExpensesTableModel):
+    """
+    Same table as ExpensesTableModel, over search results of any month: the
+    first column holds the full date.
+    """
+    HEADERS = ["Date", "Category", "Value", "Description", ""]
 
-        for item in self.items_print:
-            
-            label_item = QLabel(item)
-            label_item.setFixedWidth(500)
-        
-            delete_button = QPushButton("Delete")
-            delete_button.setStyleSheet("color: red")
-            delete_button.setFixedWidth(100)
-            delete_button.clicked.connect(self.delete_item)
-
-            h_layout = QHBoxLayout()
-            h_layout.addWidget(QLabel(item))
-            h_layout.addWidget(delete_button)
-            item_widget = QWidget()
-            item_widget.setLayout(h_layout)
-
-            list_item = QListWidgetItem()
-            sizeHint = item_widget.sizeHint()
-            sizeHint.setHeight(40)
-            list_item.setSizeHint(sizeHint)
-            self.list_widget.addItem(list_item)
-            self.list_widget.setItemWidget(list_item, item_widget)
+    def format_date(self, record):
+        return record.full_date()
 
+
+class SearchWindow(QMainWindow):
+    def __init__(self, db_handler, text):
+        super().__init__()
+
+        self.db_handler = db_handler
         
-    def delete_item(self):
-
-        clicked_signal = self.sender() # Get which button sent a signal
-        globalPoint = clicked_signal.mapToGlobal(QPoint())
-        localPoint = self.list_widget.viewport().mapFromGlobal(globalPoint) # Finding which row of the list our clicked widget is
-        widget = self.list_widget.itemAt(localPoint) # Getting the widget
-        item = self.list_widget.itemWidget(widget).findChild(QLabel).text() #Getting the QLabel.text() of the widget 
-        self.list_widget.takeItem( self.list_widget.row(widget) ) #Exclude widget from list 
+        self.setWindowTitle(f"Expenses matching '{text}'")
+        self.setGeometry(550, 300, 800, 400)
         
-        for idx in range(len(self.items_print)): #Finding the info of the item based on idx of the print list 
-            if self.items_print[idx] == item:
-                expense_to_exclude = self.items[idx]
-                break
-        self.db_handler.delete_entry(self.month, self.year, *expense_to_exclude)
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout = QVBoxLayout()
+
+        self.label_results = QLabel("Searching...")
+        self.layout.addWidget(self.label_results)
+
+        self.table_view = QTableView()
+        self.table_view.setSelectionMode(QTableView.NoSelection)
+        self.table_view.setEditTriggers(QTableView.NoEditTriggers)
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.verticalHeader().setDefaultSectionSize(40)
+        self.table_view.setSortingEnabled(True)
+        self.delete_delegate = DeleteButtonDelegate(self.table_view)
+        self.delete_delegate.deleteClicked.connect(self.delete_item)
+        self.table_view.setItemDelegateForColumn(ExpensesTableModel.DELETE_COLUMN, self.delete_delegate)
+        self.layout.addWidget(self.table_view)
+        self.central_widget.setLayout(self.layout)
+
+        self.search_worker = QueryWorker(self.db_handler.db_file, self)
+        self.search_worker.resultReady.connect(self.set_results)
+        self.search_worker.submit(DatabaseHandler.search, text)
+
+    def set_results(self, rows):
+        # Results come ordered by relevance, the view keeps that order until a header is clicked
+        self.model = SearchResultsModel(records_from_rows(rows), self)
+        self.table_view.setModel(self.model)
+        self.table_view.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
+        self.table_view.setColumnWidth(0, 100)
+        self.table_view.setColumnWidth(1, 120)
+        self.table_view.setColumnWidth(2, 90)
+        self.table_view.setColumnWidth(ExpensesTableModel.DELETE_COLUMN, 100)
+        self.label_results.setText(f"{len(rows)} expenses found" if rows else "No expenses found")
+
+    def delete_item(self, index):
+        row = index.row()
+        if self.db_handler.delete_entry_by_id(self.model.expense_id(row)):
+            self.model.remove_row(row)
 
   
 class DateWindow(QMainWindow):
@@ -251,6 +409,10 @@ class DateWindow(QMainWindow):
         self.canvas_summary_date = FigureCanvasQTAgg(self.figure_summary_date)
         self.layout.addSpacing(10)
         self.layout.addWidget(self.canvas_summary_date)
+        self.summary_chart = CategoryBarChart(self.figure_summary_date, hide_yaxis=True)
+        self.refresh_gate = ChangeGate(f"Summary {self.month} {self.year}")
+        self.summary_worker = QueryWorker(self.db_handler.db_file, self)
+        self.summary_worker.resultReady.connect(self.drawSummaryDate)
         self.plotSummaryDate()
         self.timer_plotSummary = QTimer() # Put timer to always update plot summary
         self.timer_plotSummary.timeout.connect(self.plotSummaryDate)
@@ -260,6 +422,8 @@ class DateWindow(QMainWindow):
 
     def closeEvent(self, event):
         # Override closeEvent to avoid closing the main window while this one is open
+        self.timer_plotSummary.stop()
+        self.refresh_gate.report()
         self.closed.emit() #Emit signal so that the main window knows this one is now closed.
         event.accept() 
 
@@ -301,33 +465,20 @@ class DateWindow(QMainWindow):
         self.expenses_window = ExpensesWindow(self.db_handler, self.month, self.year)
         self.expenses_window.show()
 
+    @instrumented("ui.plotSummaryDate")
     def plotSummaryDate(self):
-        self.figure_summary_date.clear()
-        ax = self.figure_summary_date.add_subplot(111)
-        
-        expenses = self.db_handler.get_elements_period(self.month, self.year)
-        if len(expenses) > 0:
-            dict_expenses = {}
-            for category in CATEGORIES_AVAILABLE:
-                total = 0.0
-                for expense in expenses:
-                    if expense[1] == category:
-                        total += float(expense[2])
-                dict_expenses[category] = total
-            
-            types_expenses = list(dict_expenses.keys())
-            values_expenses = list(dict_expenses.values())
-            ax.bar(types_expenses, values_expenses, color='#5688e5')
-            for day, value in zip(types_expenses, values_expenses):
-                ax.text(day, value + 0.1, "{:.2f}€".format(value), ha='center', va='bottom')
-
-            ax.set_title("Total: {:.2f}€".format(sum(values_expenses)), loc='right')
-            ax.set_ylim(top=1.15*max(values_expenses))
+        if not self.refresh_gate.changed(self.db_handler.get_change_token()):
+            return # Nothing was written since the last redraw
+        self.summary_worker.submit(summary_date, self.month, self.year) # Drawn by drawSummaryDate once ready
+
+    @instrumented("ui.drawSummaryDate")
+    def drawSummaryDate(self, dict_expenses):
+        if dict_expenses is not None:
+            values_expenses = [dict_expenses[category] for category in CATEGORIES_AVAILABLE]
+            self.summary_chart.update(values_expenses, title="Total: {:.2f}€".format(sum(values_expenses)))
         else:
-            ax.text(0.5, 0.5, "No expenses so far", fontsize=10, ha='center', va='center')
-        
-        ax.get_yaxis().set_visible(False)
-        self.canvas_summary_date.draw()
+            self.summary_chart.update(None)
+        self.canvas_summary_date.draw_idle()
 
 
 class ConfirmationDateWindow(QMainWindow):
@@ -402,7 +553,8 @@ class ExpenseManager(QMainWindow):
         self.h_layout_input.addWidget(self.input_month)
         
         self.input_year = QComboBox()
-        self.input_year.addItems(["Year..."] + YEARS)
+        self.years = self.db_handler.get_years()
+        self.input_year.addItems(["Year..."] + self.years)
         currentYear = time.strftime("%Y")
         self.input_year.setCurrentText(currentYear)
         self.input_year.setFixedWidth(80)
@@ -415,6 +567,12 @@ class ExpenseManager(QMainWindow):
         
         self.h_layout_input.setSpacing(6) # space between the blank spaces and button
         self.h_layout_input.addStretch() # align to the left
+
+        self.input_search = QLineEdit()
+        self.input_search.setFixedWidth(200)
+        self.input_search.setPlaceholderText("Search expenses...")
+        self.input_search.returnPressed.connect(self.open_SearchWindow)
+        self.h_layout_input.addWidget(self.input_search)
         self.layout.addLayout(self.h_layout_input)
 
         """
@@ -424,6 +582,10 @@ class ExpenseManager(QMainWindow):
         self.figure_summary_all.set_tight_layout(True)
         self.canvas_summary_all = FigureCanvasQTAgg(self.figure_summary_all)
         self.layout.addWidget(self.canvas_summary_all)
+        self.summary_chart = CategoryBarChart(self.figure_summary_all, with_errors=True)
+        self.refresh_gate = ChangeGate("Summary all months")
+        self.summary_worker = QueryWorker(self.db_handler.db_file, self)
+        self.summary_worker.resultReady.connect(self.drawSummaryAllMonths)
         self.plotSummaryAllMonths()
         self.timer_plotSummary = QTimer() # Put timer to always update plot summary
         self.timer_plotSummary.timeout.connect(self.plotSummaryAllMonths)
@@ -438,13 +600,22 @@ class ExpenseManager(QMainWindow):
         if self.date_window is not None: 
             event.ignore()
         else:
+            self.timer_plotSummary.stop()
+            self.refresh_gate.report()
             self.db_handler.close_connection()
             event.accept()
 
+    def open_SearchWindow(self):
+        text = self.input_search.text().strip()
+        if not text:
+            return
+        self.search_window = SearchWindow(self.db_handler, text)
+        self.search_window.show()
+
     def open_WindowDate(self):
         month = self.input_month.currentText() 
         year  = self.input_year.currentText()
-        if month not in MONTHS or year not in YEARS:
+        if month not in MONTHS or year not in self.years:
             return
 
         year_today, month_today = time.strftime("%Y,%m").split(',')
@@ -467,42 +638,28 @@ class ExpenseManager(QMainWindow):
     def close_WindowDate(self):
         self.date_window = None
 
+    @instrumented("ui.plotSummaryAllMonths")
     def plotSummaryAllMonths(self):
-        self.figure_summary_all.clear()
-        
+        year, month = time.strftime("%Y,%m").split(',')
+        # The window also moves when the month changes, not only when the data does
+        if not self.refresh_gate.changed((self.db_handler.get_change_token(), year, month)):
+            return
+        month = MONTHS[int(month)-1] #Convert to proper month name 
+        self.summary_worker.submit(summary_all_months, month, year) # Drawn by drawSummaryAllMonths once ready
+
+    @instrumented("ui.drawSummaryAllMonths")
+    def drawSummaryAllMonths(self, summary):
         year, month = time.strftime("%Y,%m").split(',')
         month_label = MONTHS[int(month)-2] # The name of the month before, for the plot
         year_label = year if month_label != "December" else str( int(year)-1 )
-        month = MONTHS[int(month)-1] #Convert to proper month name 
         
-        items = self.db_handler.get_cumulative_expenses_until_period(month, year)
-        ax = self.figure_summary_all.add_subplot(111)
-        if len(items) > 0:
-            types_expenses = CATEGORIES_AVAILABLE.copy()
-            values_expenses = []
-            for category in CATEGORIES_AVAILABLE:
-                aux = [items[key][category] for key in items.keys()]
-                mean, std = np.mean(aux), np.std(aux)
-                values_expenses.append([mean, std])
-
-            values_expenses = np.array(values_expenses)
-            ax.bar(types_expenses, values_expenses.T[0], color='#5688e5')
-            ax.errorbar(range(len(types_expenses)), values_expenses.T[0], yerr=values_expenses.T[1], 
-                        fmt='.', color='black', capsize=2, alpha=0.3)
-            for day, value, std in zip(types_expenses, values_expenses.T[0], values_expenses.T[1]):
-                ax.text(day, value+std + 75, "{:.2f}€".format(value), ha='center', va='bottom')
-                ax.text(day, value+std + 0.5, "(±{:d}€)".format(int(std)), ha='center', va='bottom', fontsize=7)
-
-            ax.set_title(f"Average of expenses until {month_label} {year_label}"+" [Total: {:.2f}€]".format(sum(values_expenses.T[0])), loc='right')
-            
-            value_plus_std = np.sum(values_expenses, axis=1)
-            ax.set_ylim(top=1.25*max(value_plus_std))
-            
+        if summary is not None:
+            means, stds = summary
+            title = f"Average of expenses until {month_label} {year_label}"+" [Total: {:.2f}€]".format(sum(means))
+            self.summary_chart.update(means, stds, title=title)
         else:
-            ax.text(0.5, 0.5, "No expenses so far", fontsize=10, ha='center', va='center')
-
-        
-        self.canvas_summary_all.draw()
+            self.summary_chart.update(None)
+        self.canvas_summary_all.draw_idle()
 
 
 
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import numpy as np
+
+from .utils import (
+    CATEGORIES_AVAILABLE,
+)
+from .database import (
+    DatabaseHandler,
+)
+
+"""
+Columnar copy of the ledger for analytics. Every expense is one entry in
+each of the NumPy columns below, stored as raw files next to the database
+and memory-mapped, so opening the cache costs nothing and reductions
+(sums, means, stds over months/categories/date ranges) are vectorized.
+"""
+
+COLUMNS = {
+    "ids": np.int64,
+    "cents": np.int64,
+    "days": np.int32,       # Days since 1970-01-01
+    "categories": np.uint8, # Index in CATEGORIES_AVAILABLE
+}
+_CATEGORY_IDS = {name: idx for idx, name in enumerate(CATEGORIES_AVAILABLE)}
+
+def dates_to_days(dates):
+    # YYYYMMDD integers -> days since 1970-01-01
+    dates = np.asarray(dates, dtype=np.int64)
+    months = (dates // 10000 - 1970)*12 + (dates // 100 % 100 - 1)
+    return (months.astype('M8[M]').astype('M8[D]') - np.datetime64('1970-01-01', 'D')).astype(np.int32) + (dates % 100 - 1).astype(np.int32)
+
+def days_to_month_index(days):
+    # Days since 1970-01-01 -> months since January 1970
+    return np.asarray(days).astype('M8[D]').astype('M8[M]').astype(np.int64)
+
+def _to_yyyymmdd(date):
+    return date.year*10000 + date.month*100 + date.day if hasattr(date, "year") else int(date)
+
+def month_index(month: int, year: int):
+    return (int(year) - 1970)*12 + int(month) - 1
+
+class LedgerColumns:
+    """
+    Memory-mapped columns of the `expenses` table, refreshed incrementally.
+    Only rows with an id above the cached ones are appended; if anything else
+    changed (deletes, updates), detected with the database write generation,
+    the columns are rebuilt from scratch.
+    One instance per cache directory should be shared by every thread: refreshes
+    and reductions are serialized by `lock`, so no thread reads a column while
+    another one is rewriting it.
+    """
+    def __init__(self, db_handler: DatabaseHandler, cache_dir: str = None):
+        self.db_handler = db_handler
+        if cache_dir is None:
+            cache_dir = os.path.splitext(db_handler.db_file)[0] + ".columns"
+        self.cache_dir = cache_dir
+        self.lock = threading.RLock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.meta_filename = os.path.join(self.cache_dir, "meta.json")
+        self.meta = self.read_meta()
+        self.load()
+
+    def column_filename(self, name: str):
+        return os.path.join(self.cache_dir, f"{name}.bin")
+
+    def read_meta(self):
+        try:
+            with open(self.meta_filename, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"count": 0, "max_id": 0, "generation": None}
+
+    def write_meta(self):
+        tmp_filename = self.meta_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_filename, self.meta_filename)
+
+    def load(self):
+        # Map the first meta["count"] entries of every column (a crash may have left a longer file)
+        count = self.meta["count"]
+        for name, dtype in COLUMNS.items():
+            if count == 0:
+                column = np.empty(0, dtype=dtype)
+            else:
+                column = np.memmap(self.column_filename(name), dtype=dtype, mode='r', shape=(count,))
+            setattr(self, name, column)
+
+    def append(self, rows, truncate: bool = False, suffix: str = ""):
+        # rows: [(id, date, category, value_cents)] ordered by id, written to the column files + `suffix`
+        if not rows:
+            return
+        ids, dates, categories, cents = zip(*rows)
+        data = {
+            "ids": np.array(ids, dtype=np.int64),
+            "cents": np.array(cents, dtype=np.int64),
+            "days": dates_to_days(dates),
+            "categories": np.array([_CATEGORY_IDS[c] for c in categories], dtype=np.uint8),
+        }
+        for name, dtype in COLUMNS.items():
+            filename = self.column_filename(name) + suffix
+            with open(filename, "r+b" if os.path.exists(filename) and not truncate else "wb") as f:
+                f.truncate(self.meta["count"]*np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(data[name].tobytes())
+        self.meta["count"] += len(rows)
+        self.meta["max_id"] = int(data["ids"][-1])
+
+    def rebuild(self, chunk_size: int = 100000):
+        # Written to new files that replace the old ones: arrays still mapping the old files stay valid
+        with self.lock:
+            self.meta = {"count": 0, "max_id": 0, "generation": None}
+            cursor = self.db_handler.conn.cursor()
+            generation = self.db_handler.get_generation()
+            cursor.execute('SELECT id, date, category, value_cents FROM expenses ORDER BY id')
+            truncate = True
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                self.append(rows, truncate=truncate, suffix=".tmp")
+                truncate = False
+            if truncate: # Empty ledger
+                for name in COLUMNS:
+                    open(self.column_filename(name) + ".tmp", "wb").close()
+            self.write_meta() # generation None: a crash while replacing the files means another rebuild
+            for name in COLUMNS:
+                os.replace(self.column_filename(name) + ".tmp", self.column_filename(name))
+            self.meta["generation"] = generation
+            self.write_meta()
+            self.load()
+
+    def refresh(self):
+        """
+        Bring the columns up to date with the database. Returns "fresh",
+        "appended" or "rebuilt".
+        """
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self):
+        generation = self.db_handler.get_generation()
+        if generation is not None and generation == self.meta["generation"]:
+            return "fresh"
+        cursor = self.db_handler.conn.cursor()
+        cursor.execute('SELECT id, date, category, value_cents FROM expenses WHERE id > ? ORDER BY id',
+                       (self.meta["max_id"],))
+        rows = cursor.fetchall()
+        # Each inserted row bumps the generation by one: any other difference means deletes/updates
+        if self.meta["generation"] is None or generation is None or generation != self.meta["generation"] + len(rows):
+            self.rebuild()
+            return "rebuilt"
+        self.append(rows)
+        self.meta["generation"] = generation
+        self.write_meta()
+        self.load()
+        return "appended"
+
+    def monthly_totals(self, first_month: int, end_month: int):
+        """
+        Totals in cents as a [months, categories] matrix, for the months
+        [first_month, end_month) given as month_index() values.
+        """
+        n_months = max(end_month - first_month, 0)
+        n_categories = len(CATEGORIES_AVAILABLE)
+        with self.lock:
+            months = days_to_month_index(self.days) - first_month
+            mask = (months >= 0) & (months < n_months)
+            flat = months[mask]*n_categories + self.categories[mask]
+            totals = np.bincount(flat, weights=self.cents[mask], minlength=n_months*n_categories)
+        return totals.reshape(n_months, n_categories)
+
+    def mean_std_until(self, month: int, year: int):
+        # Mean and std (in euros) of the monthly totals per category, from the first month
+        # with expenses until (excluding) month/year
+        end_month = month_index(month, year)
+        with self.lock:
+            months = days_to_month_index(self.days)
+            months = months[months < end_month]
+            if len(months) == 0:
+                return None
+            totals = self.monthly_totals(int(months.min()), end_month)/100
+        if len(totals) == 0:
+            return None
+        return totals.mean(axis=0), totals.std(axis=0)
+
+    def range_totals(self, start, end, category: str = None):
+        """
+        Totals in euros per category over the dates [start, end), datetime.date or YYYYMMDD.
+        With `category` only that category's total is returned.
+        """
+        start_day, end_day = dates_to_days([_to_yyyymmdd(start), _to_yyyymmdd(end)])
+        with self.lock:
+            mask = (self.days >= start_day) & (self.days < end_day)
+            totals = np.bincount(self.categories[mask], weights=self.cents[mask], minlength=len(CATEGORIES_AVAILABLE))/100
+        if category is not None:
+            return float(totals[_CATEGORY_IDS[category]])
+        return {name: float(total) for name, total in zip(CATEGORIES_AVAILABLE, totals)}
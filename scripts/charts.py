@@ -0,0 +1,84 @@
+import numpy as np
+
+from .utils import (
+    CATEGORIES_AVAILABLE,
+)
+
+BAR_COLOR = '#5688e5'
+
+class CategoryBarChart:
+    """
+    Per-category bar chart drawn on a matplotlib Figure (Qt canvas or Agg).
+    All artists (bars, error bars, labels) are created once; update() only
+    changes heights, positions, texts and limits, so a refresh does not
+    rebuild the axes. With `with_errors` the chart shows mean ± std, as the
+    summary of all months does.
+    """
+    def __init__(self, figure, with_errors: bool = False, hide_yaxis: bool = False):
+        self.figure = figure
+        self.with_errors = with_errors
+        self.ax = figure.add_subplot(111)
+        self.x = np.arange(len(CATEGORIES_AVAILABLE))
+        zeros = np.zeros(len(self.x))
+
+        self.bars = self.ax.bar(CATEGORIES_AVAILABLE, zeros, color=BAR_COLOR)
+        self.value_labels = [self.ax.text(x, 0, "", ha='center', va='bottom') for x in self.x]
+        if with_errors:
+            self.errorbar = self.ax.errorbar(self.x, zeros, yerr=zeros, fmt='.', color='black', capsize=2, alpha=0.3)
+            self.std_labels = [self.ax.text(x, 0, "", ha='center', va='bottom', fontsize=7) for x in self.x]
+        self.empty_label = self.ax.text(0.5, 0.5, "No expenses so far", fontsize=10, ha='center', va='center',
+                                        transform=self.ax.transAxes, visible=False)
+        if hide_yaxis:
+            self.ax.get_yaxis().set_visible(False)
+
+    def data_artists(self):
+        artists = list(self.bars) + self.value_labels
+        if self.with_errors:
+            data_line, caplines, barlinecols = self.errorbar.lines
+            artists += [data_line, *caplines, *barlinecols] + self.std_labels
+        return artists
+
+    def show_empty(self):
+        for artist in self.data_artists():
+            artist.set_visible(False)
+        self.ax.set_title("", loc='right')
+        self.ax.set_ylim(0, 1)
+        self.empty_label.set_visible(True)
+
+    def update(self, values, stds=None, title: str = ""):
+        """
+        `values` per category (None when there is nothing to show), and for the
+        error bar chart their `stds`.
+        """
+        if values is None:
+            self.show_empty()
+            return
+        self.empty_label.set_visible(False)
+        for artist in self.data_artists():
+            artist.set_visible(True)
+
+        values = np.asarray(values, dtype=float)
+        for bar, value in zip(self.bars, values):
+            bar.set_height(value)
+
+        if self.with_errors:
+            stds = np.asarray(stds, dtype=float)
+            data_line, (lower_caps, upper_caps), (barlines,) = self.errorbar.lines
+            data_line.set_data(self.x, values)
+            lower_caps.set_data(self.x, values - stds)
+            upper_caps.set_data(self.x, values + stds)
+            barlines.set_segments([[(x, value - std), (x, value + std)] for x, value, std in zip(self.x, values, stds)])
+            for label, std_label, x, value, std in zip(self.value_labels, self.std_labels, self.x, values, stds):
+                label.set_position((x, value + std + 75))
+                label.set_text("{:.2f}€".format(value))
+                std_label.set_position((x, value + std + 0.5))
+                std_label.set_text("(±{:d}€)".format(int(std)))
+            top = 1.25*max(values + stds)
+        else:
+            for label, x, value in zip(self.value_labels, self.x, values):
+                label.set_position((x, value + 0.1))
+                label.set_text("{:.2f}€".format(value))
+            top = 1.15*max(values)
+
+        self.ax.set_title(title, loc='right')
+        self.ax.set_ylim(0, top if top > 0 else 1)
@@ -1,114 +1,613 @@
 import sqlite3
-import shutil
+import threading
+import re
 import time
 import os
 
 from .utils import(
     DB_FILENAME,
-    YEARS,
-    MONTHS,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
     CATEGORIES_AVAILABLE,
-    MAIN_DIR
+    DICT_MONTHS_NAMETONUMBER,
+    DICT_MONTHS_NUMBERTONAME,
+    BACKUP_KEEP_DAILY,
+    BACKUP_KEEP_MONTHLY,
+    iter_periods,
+    next_period,
 )
+from .instrumentation import (
+    instrument_class,
+    instrumented,
+)
+
+"""
+Schema history, tracked with PRAGMA user_version:
+  0 -> legacy `user_data` table, every column stored as TEXT.
+  1 -> `expenses` table with an integer primary key, the date as an
+       integer YYYYMMDD and the amount as integer cents.
+  2 -> `monthly_totals` rollup, one row per (YYYYMM, category), kept in
+       sync with `expenses` by triggers so every writer is covered.
+  3 -> `ledger_state` holding a write generation, bumped by triggers on
+       every change of `expenses` (used e.g. to skip unneeded backups).
+  4 -> `expenses_fts` FTS5 index over the descriptions, external content
+       table kept in sync with `expenses` by triggers.
+  5 -> `expenses.source_key` with a unique index, identifying where an
+       ingested expense comes from (e.g. "telegram:<update id>") so that
+       ingesting it again is a no-op. NULL for expenses added by hand.
+"""
+
+def _to_date(month: str, year, day) -> int:
+    # Month name + year + day -> YYYYMMDD, so a whole month is the range [YYYYMM00, YYYYMM99]
+    return int(year)*10000 + DICT_MONTHS_NAMETONUMBER[month]*100 + int(day)
+
+def _period_range(month: str, year):
+    start = _to_date(month, year, 0)
+    return start, start + 99
+
+def _to_date_key(date) -> int:
+    # datetime.date or YYYYMMDD -> YYYYMMDD
+    if hasattr(date, "year"):
+        return date.year*10000 + date.month*100 + date.day
+    return int(date)
+
+def _to_cents(value) -> int:
+    return int(round(float(value)*100))
+
+def _migrate_to_v1(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expenses (
+                        id INTEGER PRIMARY KEY,
+                        date INTEGER NOT NULL,
+                        category TEXT NOT NULL,
+                        value_cents INTEGER NOT NULL,
+                        description TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_date_category ON expenses (date, category)')
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_data'")
+    if cursor.fetchone() is None:
+        return
+    # Legacy rows are TEXT-only: convert month name/value once here instead of on every read
+    cursor.execute('SELECT month, year, day, category, value, description FROM user_data')
+    rows = [
+        (_to_date(month, year, day), category, _to_cents(value), description)
+        for month, year, day, category, value, description in cursor.fetchall()
+    ]
+    rows.sort(key=lambda x: x[0]) # Ids follow the date order of the old ledger
+    cursor.executemany('INSERT INTO expenses (date, category, value_cents, description) VALUES (?, ?, ?, ?)', rows)
+    cursor.execute('DROP TABLE user_data')
+
+def _migrate_to_v2(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_totals (
+                        period INTEGER NOT NULL,
+                        category TEXT NOT NULL,
+                        total_cents INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (period, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO monthly_totals VALUES (NEW.date / 100, NEW.category, NEW.value_cents, 1)
+                ON CONFLICT (period, category) DO UPDATE SET
+                    total_cents = total_cents + excluded.total_cents,
+                    count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+            UPDATE monthly_totals SET total_cents = total_cents - OLD.value_cents, count = count - 1
+                WHERE period = OLD.date / 100 AND category = OLD.category;
+            DELETE FROM monthly_totals WHERE period = OLD.date / 100 AND category = OLD.category AND count = 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF date, category, value_cents ON expenses BEGIN
+            UPDATE monthly_totals SET total_cents = total_cents - OLD.value_cents, count = count - 1
+                WHERE period = OLD.date / 100 AND category = OLD.category;
+            DELETE FROM monthly_totals WHERE period = OLD.date / 100 AND category = OLD.category AND count = 0;
+            INSERT INTO monthly_totals VALUES (NEW.date / 100, NEW.category, NEW.value_cents, 1)
+                ON CONFLICT (period, category) DO UPDATE SET
+                    total_cents = total_cents + excluded.total_cents,
+                    count = count + 1;
+        END
+    ''')
+    _rebuild_monthly_totals(cursor)
+
+def _rebuild_monthly_totals(cursor):
+    cursor.execute('DELETE FROM monthly_totals')
+    cursor.execute('''INSERT INTO monthly_totals
+                    SELECT date / 100, category, SUM(value_cents), COUNT(*) FROM expenses
+                    GROUP BY date / 100, category
+    ''')
+
+def _migrate_to_v3(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS ledger_state (generation INTEGER NOT NULL)')
+    cursor.execute('INSERT INTO ledger_state SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM ledger_state)')
+    for event in ("INSERT", "DELETE", "UPDATE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_generation_{event.lower()} AFTER {event} ON expenses BEGIN
+                UPDATE ledger_state SET generation = generation + 1;
+            END
+        ''')
+
+def _migrate_to_v4(cursor):
+    # Prefix indexes make the "term*" queries of search() index lookups as well
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+                        description,
+                        content='expenses',
+                        content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2',
+                        prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF description ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+            INSERT INTO expenses_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+    ''')
+    cursor.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+
+def _migrate_to_v5(cursor):
+    cursor.execute('ALTER TABLE expenses ADD COLUMN source_key TEXT')
+    # Partial index: only ingested expenses have a key, the ones added by hand cost nothing
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_source_key ON expenses (source_key) WHERE source_key IS NOT NULL')
+
+MIGRATIONS = [
+    _migrate_to_v1,
+    _migrate_to_v2,
+    _migrate_to_v3,
+    _migrate_to_v4,
+    _migrate_to_v5,
+]
+
+# Field matching only picks the oldest matching row, removal itself is a primary-key delete
+_DELETE_MATCHING = '''DELETE FROM expenses WHERE id = (
+                        SELECT id FROM expenses WHERE
+                        date=? AND
+                        category=? AND
+                        value_cents=? AND
+                        description=?
+                        ORDER BY id LIMIT 1
+)'''
+
+def _connect(db_file: str):
+    """
+    Open a connection tuned for the UI and the bot writing the same file at once:
+    WAL lets readers and the single writer proceed concurrently, and the busy
+    timeout makes a writer wait for the other process' lock instead of failing
+    with "database is locked". With synchronous=NORMAL the WAL is only synced at
+    checkpoints: the last committed transactions can be lost on a power failure or
+    OS crash (not when only the application crashes), but the database is never
+    corrupted. That is worth the fraction of the fsyncs for a personal ledger.
+    """
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS/1000, check_same_thread=False)
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL') # Persistent: only the first connection ever converts the file
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ConnectionPool:
+    """
+    One sqlite3 connection per thread, opened on the first use from that thread
+    and reused afterwards. Connections of threads that have finished are closed
+    the next time a new one is opened.
+    """
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = [] # [(thread, connection)]
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.db_file)
+            with self._lock:
+                for thread, old_conn in self._connections:
+                    if not thread.is_alive():
+                        old_conn.close()
+                self._connections = [(thread, c) for thread, c in self._connections if thread.is_alive()]
+                self._connections.append((threading.current_thread(), conn))
+        return conn
+
+    def cursor(self):
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection().cursor()
+        return cursor
+
+    def close_all(self):
+        with self._lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
 
 class DatabaseHandler:
-    
-    def __init__(self):
-        self.db_file = DB_FILENAME
+    """
+    Every method may be called from any thread: `conn`/`cursor` are the
+    calling thread's own connection, taken from the handler's pool.
+    """
+    def __init__(self, db_file: str = DB_FILENAME):
+        self.db_file = db_file
         
-        self.conn = sqlite3.connect(self.db_file)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_data (
-                            month TEXT,
-                            year TEXT,
-                            day TEXT,
-                            category TEXT,
-                            value TEXT,
-                            description TEXT
-            )                   
-        ''')
+        self.pool = ConnectionPool(self.db_file)
+        self.migrate()
+
+    @property
+    def conn(self):
+        return self.pool.connection()
+
+    @property
+    def cursor(self):
+        return self.pool.cursor()
+
+    def migrate(self):
+        # Bring the database up to the latest schema. Each step runs in its own transaction,
+        # so an interrupted migration is simply resumed on the next open. The version is read
+        # again under the write lock, in case another process migrated in the meantime.
+        if self.cursor.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+            return
+        for new_version, migration in enumerate(MIGRATIONS, start=1):
+            with self.conn:
+                self.cursor.execute('BEGIN IMMEDIATE')
+                if self.cursor.execute('PRAGMA user_version').fetchone()[0] < new_version:
+                    migration(self.cursor)
+                    self.cursor.execute(f'PRAGMA user_version = {new_version}')
     
+    def get_change_token(self):
+        # Cheap token that moves whenever the data may have changed: PRAGMA data_version catches commits
+        # from other connections (e.g. the bot), total_changes the writes done through this one.
+        data_version = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+        return (data_version, self.conn.total_changes)
+
+    def get_generation(self):
+        # Persistent write generation, shared by every process using the database
+        return _read_generation(self.conn)
+
     def close_connection(self):
-        self.conn.close()
+        # Closes the connections of every thread: call it once nothing uses the handler anymore
+        self.pool.close_all()
 
     def add_entry(self, month: str, year: str, day: str, category: str, value: str, description: str):
-        self.cursor.execute('INSERT INTO user_data VALUES (?, ?, ?, ?, ?, ?)',
-                            (month, year, day, category, value, description))
+        self.cursor.execute('INSERT INTO expenses (date, category, value_cents, description) VALUES (?, ?, ?, ?)',
+                            (_to_date(month, year, day), category, _to_cents(value), description))
         self.conn.commit()
 
     def delete_entry(self, month: str, year: str, day: str, category: str, value: str, description: str):
-        self.cursor.execute('''DELETE FROM user_data WHERE 
-                            month=? AND 
-                            year=? AND
-                            day=? AND
-                            category=? AND
-                            value=? AND
-                            description=?
-        ''',(month, year, day, category, value, description))
+        # Deletes a single expense matching all fields; identical duplicates are left in place
+        self.cursor.execute(_DELETE_MATCHING, (_to_date(month, year, day), category, _to_cents(value), description))
+        if self.cursor.rowcount > 0:
+            self.conn.commit()
+            return True
+        else:
+            return False
+
+    def delete_entry_by_id(self, expense_id: int):
+        self.cursor.execute('DELETE FROM expenses WHERE id=?', (int(expense_id),))
         if self.cursor.rowcount > 0:
             self.conn.commit()
             return True
         else:
             return False
     
+    def add_entries(self, entries):
+        """
+        Insert many expenses in a single transaction. `entries` is an iterable of
+        dicts with the same keys as the add_entry arguments.
+        Returns one bool per entry; if the insert fails the whole batch is rolled back
+        and every entry is reported as failed.
+        """
+        rows = []
+        results = []
+        for entry in entries:
+            try:
+                rows.append((_to_date(entry["month"], entry["year"], entry["day"]), entry["category"],
+                             _to_cents(entry["value"]), entry["description"]))
+                results.append(True)
+            except (KeyError, ValueError, TypeError):
+                results.append(False)
+        if self.add_records(rows) is None:
+            return [False]*len(results) # One per entry, `entries` may be an iterator
+        return results
+
+    def add_records(self, records, source_keys=None):
+        """
+        Insert already typed (YYYYMMDD, category, value_cents, description) tuples,
+        e.g. from processInput.parse_batch, in a single transaction. With `source_keys`
+        (one per record), records whose key is already in the database are skipped.
+        Returns the number of inserted records, or None if the batch was rolled back.
+        """
+        try:
+            with self.conn:
+                if source_keys is None:
+                    self.cursor.executemany('INSERT INTO expenses (date, category, value_cents, description) VALUES (?, ?, ?, ?)', records)
+                else:
+                    # The unique index does the deduplication, there is no lookup before inserting
+                    self.cursor.executemany('''INSERT OR IGNORE INTO expenses (date, category, value_cents, description, source_key)
+                                            VALUES (?, ?, ?, ?, ?)''',
+                                            (tuple(record) + (key,) for record, key in zip(records, source_keys)))
+                inserted = self.cursor.rowcount
+        except sqlite3.Error:
+            return None
+        return max(inserted, 0)
+
+    def get_ids_by_source_key(self, source_keys):
+        # {source_key: id} of the expenses with one of these keys, e.g. to report the ids of add_records
+        source_keys = list(source_keys)
+        ids = {}
+        for start in range(0, len(source_keys), 500): # Below SQLite's limit of bound parameters
+            chunk = source_keys[start:start + 500]
+            self.cursor.execute(f'SELECT source_key, id FROM expenses WHERE source_key IN ({", ".join("?"*len(chunk))})', chunk)
+            ids.update(self.cursor.fetchall())
+        return ids
+
+    def delete_entries(self, entries):
+        """
+        Delete many expenses in a single transaction. An entry is either {"id": ...},
+        or has the add_entries keys, in which case one matching expense is deleted.
+        Returns one bool per entry telling if it matched something (all False if the
+        batch was rolled back).
+        """
+        entries = list(entries)
+        results = []
+        try:
+            with self.conn:
+                for entry in entries:
+                    try:
+                        if "id" in entry:
+                            query, params = 'DELETE FROM expenses WHERE id=?', (int(entry["id"]),)
+                        else:
+                            query, params = _DELETE_MATCHING, (_to_date(entry["month"], entry["year"], entry["day"]),
+                                                               entry["category"], _to_cents(entry["value"]), entry["description"])
+                        self.cursor.execute(query, params)
+                    except (KeyError, ValueError, TypeError, OverflowError):
+                        # A malformed entry, or an integer beyond SQLite's 64 bits (raised before executing)
+                        results.append(False)
+                        continue
+                    results.append(self.cursor.rowcount > 0)
+        except sqlite3.Error:
+            return [False]*len(entries)
+        return results
+
+    def rebuild_monthly_totals(self):
+        # Recompute the rollup from scratch, e.g. after editing the database by hand
+        with self.conn:
+            self.cursor.execute('BEGIN IMMEDIATE')
+            _rebuild_monthly_totals(self.cursor)
+
+    def get_totals_period(self, month: str, year: str):
+        # Per-category totals of one month, read from the rollup. Categories without expenses are omitted.
+        self.cursor.execute('SELECT category, total_cents FROM monthly_totals WHERE period=?',
+                            (_period_range(month, year)[0] // 100,))
+        return {category: total_cents/100 for category, total_cents in self.cursor.fetchall()}
+
     def get_elements_period(self, month: str, year: str):
-        self.cursor.execute('SELECT * FROM user_data WHERE month=? AND year=?',
-                                       (month, year))
-        items = self.cursor.fetchall()
-        items_list = []
-        for item in items:
-            l = [elem for elem in item[2:]] # Getting just the important entries
-            items_list.append(l)
-        
-        items_list.sort(key=lambda x: int(x[0])) #sorting list
-        return items_list
+        # Index seek on the month range; returns [id, day, category, value, description] sorted by day
+        self.cursor.execute('''SELECT id, printf('%02d', date % 100), category, printf('%.2f', value_cents / 100.0), description
+                            FROM expenses WHERE date BETWEEN ? AND ?
+                            ORDER BY date, id
+        ''', _period_range(month, year))
+        return [list(item) for item in self.cursor.fetchall()]
     
     def get_cumulative_expenses_until_period(self, month: str, year: str):
+        """
+        {"Month|Year": {category: total}} for every month from the first one with
+        expenses until (excluding) month/year. Months without expenses are included with zeros.
+        """
+        end_period = _period_range(month, year)[0] // 100
+        self.cursor.execute('SELECT MIN(period) FROM monthly_totals WHERE period < ?', (end_period,))
+        first_period = self.cursor.fetchone()[0]
         
-        ## Create a list with all entries we should get
-        periods = []
-        to_break = False
-        for y in YEARS:
-            for m in MONTHS:
-                if y == year and m == month:
-                    to_break = True
-                    break
-                periods.append([m, y])
-            if to_break:
-                break        
-        
-        sql_query = 'SELECT * FROM user_data WHERE month=? AND year=?'
         items_list = {}
-        for period in periods:
-            m, y = period
-            self.cursor.execute(sql_query, (m,y))
-            items = self.cursor.fetchall()
-            
-            items_list[f"{m}|{y}"] = {}
-            for category in CATEGORIES_AVAILABLE:
-                items_list[f"{m}|{y}"][category] = 0.0 # Initialising with 0euros
-            
-            for item in items:
-                category = item[3]
-                value = float(item[4])
-                items_list[f"{m}|{y}"][category] += value
+        if first_period is None:
+            return items_list
+        for period in iter_periods(first_period, end_period):
+            items_list[f"{DICT_MONTHS_NUMBERTONAME[period % 100]}|{period // 100}"] = {category: 0.0 for category in CATEGORIES_AVAILABLE} # Initialising with 0euros
+
+        # Read straight from the rollup: cost is months x categories, independent of the number of expenses
+        self.cursor.execute('SELECT period, category, total_cents FROM monthly_totals WHERE period >= ? AND period < ?',
+                            (first_period, end_period))
+        for period, category, total_cents in self.cursor.fetchall():
+            key = f"{DICT_MONTHS_NUMBERTONAME[period % 100]}|{period // 100}"
+            items_list[key][category] += total_cents/100
                  
         return items_list
+
+    def get_monthly_totals_range(self, start=None, end=None, category: str = None):
+        """
+        [(YYYYMM, category, total_cents, count)] of the expenses with a date in [start, end),
+        datetime.date or YYYYMMDD, None meaning unbounded. Whole months are read from the
+        rollup; only the partial months at the edges of the range are summed from `expenses`.
+        """
+        start_key = 0 if start is None else _to_date_key(start)
+        end_key = 99999999 if end is None else _to_date_key(end)
+        first_full = start_key // 100 if start_key % 100 <= 1 else next_period(start_key // 100)
+        end_full = end_key // 100 # Months before the one of `end` are whole
+        if first_full >= end_full:
+            edges, full = [(start_key, end_key)], None
+        else:
+            edges, full = [(start_key, first_full*100), (end_full*100, end_key)], (first_full, end_full)
+
+        category_filter = '' if category is None else ' AND category = ?'
+        category_params = () if category is None else (category,)
+        totals = {}
+        if full is not None:
+            self.cursor.execute('SELECT period, category, total_cents, count FROM monthly_totals WHERE period >= ? AND period < ?' + category_filter,
+                                full + category_params)
+            for period, category_name, total_cents, count in self.cursor.fetchall():
+                totals[(period, category_name)] = [total_cents, count]
+        for edge_start, edge_end in edges:
+            if edge_start >= edge_end:
+                continue
+            self.cursor.execute('''SELECT date / 100, category, SUM(value_cents), COUNT(*) FROM expenses
+                                WHERE date >= ? AND date < ?''' + category_filter + ' GROUP BY date / 100, category',
+                                (edge_start, edge_end) + category_params)
+            for period, category_name, total_cents, count in self.cursor.fetchall():
+                total = totals.setdefault((period, category_name), [0, 0])
+                total[0] += total_cents
+                total[1] += count
+        return sorted((period, category_name, total_cents, count) for (period, category_name), (total_cents, count) in totals.items())
+
+    def get_years(self):
+        # Years to offer in the UI: from the first one with expenses (at most the current one) until next year
+        self.cursor.execute('SELECT MIN(period) FROM monthly_totals')
+        first_period = self.cursor.fetchone()[0]
+        current_year = int(time.strftime("%Y"))
+        first_year = current_year if first_period is None else min(first_period // 100, current_year)
+        return [str(y) for y in range(first_year, current_year + 2)]
+
+    def search(self, text: str, limit: int = 50, candidates: int = 2000):
+        """
+        Full-text search over the descriptions of all expenses, every word of `text`
+        matched as a prefix ("sup" finds "supermarket"). Returns up to `limit`
+        (id, YYYYMMDD, category, value_cents, description) rows, best matches first
+        (bm25), the most recent first among equally good ones. Only the `candidates`
+        best matches are joined with the expenses, which keeps very common words fast
+        on large ledgers.
+        """
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        self.cursor.execute('''SELECT expenses.id, expenses.date, expenses.category, expenses.value_cents, expenses.description
+                            FROM (
+                                SELECT rowid, rank FROM expenses_fts WHERE expenses_fts MATCH ?
+                                ORDER BY rank LIMIT ?
+                            ) AS matches
+                            JOIN expenses ON expenses.id = matches.rowid
+                            ORDER BY matches.rank, expenses.date DESC
+                            LIMIT ?
+        ''', (match, candidates, limit))
+        return self.cursor.fetchall()
+
+    def iter_range(self, start, end, category: str = None, chunk_size: int = 1000):
+        """
+        Lazily yield the (id, YYYYMMDD, category, value_cents, description) expenses with a date
+        in [start, end), ordered by date, optionally of a single category. `start`/`end` are
+        datetime.date or YYYYMMDD integers. Rows are fetched `chunk_size` at a time, so memory
+        use does not depend on the size of the range.
+        """
+        query = 'SELECT id, date, category, value_cents, description FROM expenses WHERE date >= ? AND date < ?'
+        params = [_to_date_key(start), _to_date_key(end)]
+        if category is not None:
+            query += ' AND category = ?'
+            params.append(category)
+        cursor = self.conn.cursor() # Own cursor: the caller may use the handler while iterating
+        cursor.execute(query + ' ORDER BY date, id', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
     
-def CreateBackup():
+instrument_class(DatabaseHandler, "db")
+
+def _read_generation(conn):
+    # Write generation of a database, None if it predates the ledger_state table
+    try:
+        return conn.execute('SELECT generation FROM ledger_state').fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+def _list_backups(backupDir: str, db_basename: str):
+    # [(YYYYMMDD, filename)] of the existing backups, newest first
+    prefix = db_basename.replace(".db", "_")
+    backups = []
+    for file in os.listdir(backupDir):
+        stamp = file[len(prefix):-len(".db")]
+        if file.startswith(prefix) and file.endswith(".db") and len(stamp) == 8 and stamp.isdigit():
+            backups.append((stamp, file))
+    backups.sort(reverse=True)
+    return backups
+
+def _apply_retention(backupDir: str, db_basename: str, keep_daily: int, keep_monthly: int):
+    """
+    Keep the newest `keep_daily` backups, plus the newest backup of each
+    of the `keep_monthly` most recent months. Everything else is removed.
+    """
+    backups = _list_backups(backupDir, db_basename)
+    keep = {file for _, file in backups[:keep_daily]}
+    months_kept = []
+    for stamp, file in backups:
+        if len(months_kept) >= keep_monthly:
+            break
+        if stamp[:6] not in months_kept:
+            months_kept.append(stamp[:6])
+            keep.add(file)
+    for _, file in backups:
+        if file not in keep:
+            os.remove(os.path.join(backupDir, file))
+
+@instrumented("backup.copy")
+def _run_backup(db_file: str, backupDir: str, filename_backup: str, keep_daily: int, keep_monthly: int, pages: int):
+    # Online backup: copies a consistent snapshot `pages` pages at a time, even if another process is writing
+    tmp_file = os.path.join(backupDir, filename_backup + ".tmp")
+    src = sqlite3.connect(db_file)
+    dst = sqlite3.connect(tmp_file)
+    try:
+        src.backup(dst, pages=pages, sleep=0.01)
+        dst.execute('PRAGMA journal_mode = DELETE') # Self-contained file, without -wal/-shm companions
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp_file, os.path.join(backupDir, filename_backup))
+    _apply_retention(backupDir, os.path.basename(db_file), keep_daily, keep_monthly)
+
+@instrumented("backup.create")
+def CreateBackup(db_file: str = DB_FILENAME, keep_daily: int = BACKUP_KEEP_DAILY, keep_monthly: int = BACKUP_KEEP_MONTHLY,
+                 pages: int = 256):
+    """
+    Back up the database on a background thread, using SQLite's online backup API.
+    Nothing is done if the latest backup already has the current write generation.
+    Returns the backup thread (non-daemon, so a short-lived process waits for it), or None if skipped.
+    """
+    if not os.path.isfile(db_file):
+        return None
     timestamp = time.strftime("%Y%m%d")
     
-    db_basename = os.path.basename(DB_FILENAME)
+    db_basename = os.path.basename(db_file)
     filename_backup = db_basename.replace(".db", f"_{timestamp}.db")
     
-    backupDir = os.path.join(MAIN_DIR, "Backup")
-    shutil.copy(
-        DB_FILENAME, os.path.join(backupDir, filename_backup)
-    )
+    backupDir = os.path.join(os.path.dirname(db_file), "Backup")
+    os.makedirs(backupDir, exist_ok=True)
+
+    backups = _list_backups(backupDir, db_basename)
+    if backups:
+        conn = sqlite3.connect(db_file)
+        generation = _read_generation(conn)
+        conn.close()
+        conn = sqlite3.connect(f"file:{os.path.join(backupDir, backups[0][1])}?mode=ro", uri=True)
+        backup_generation = _read_generation(conn)
+        conn.close()
+        if generation is not None and generation == backup_generation:
+            return None # Nothing changed since the last backup
     
-    for file in os.listdir(backupDir):
-        if ".db" in file and file != filename_backup:
-            os.remove(os.path.join(backupDir, file))
-            
-    return True
\ No newline at end of file
+    thread = threading.Thread(
+        target=_run_backup,
+        args=(db_file, backupDir, filename_backup, keep_daily, keep_monthly, pages),
+        name="database-backup",
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,47 @@
+import csv
+import sys
+from datetime import date
+
+from .database import (
+    DatabaseHandler
+)
+
+def parse_date(dateString: str):
+    # YYYY-MM-DD -> datetime.date
+    return date.fromisoformat(dateString)
+
+def export_range(db_handler: DatabaseHandler, f_out, start, end, category: str = None, delimiter: str = ','):
+    """
+    Write the expenses in [start, end) as CSV rows "DD/MM/YYYY,VALUE,CATEGORY,DESCRIPTION",
+    the default column layout of the import, streaming rows from the database.
+    """
+    writer = csv.writer(f_out, delimiter=delimiter)
+    count = 0
+    for _, date_key, category_name, value_cents, description in db_handler.iter_range(start, end, category):
+        writer.writerow([
+            f"{date_key % 100:02}/{date_key // 100 % 100:02}/{date_key // 10000}",
+            f"{value_cents/100:.2f}",
+            category_name,
+            description,
+        ])
+        count += 1
+    return count
+
+def mainExport(filename: str, start: str, end: str, category: str = None, delimiter: str = ','):
+    if start is None or end is None:
+        print("Please provide the range to export: main.py --method export [FILE.csv] --from YYYY-MM-DD --to YYYY-MM-DD")
+        return False
+    try:
+        start, end = parse_date(start), parse_date(end)
+    except ValueError:
+        print(f"Please provide valid dates (YYYY-MM-DD), got --from {start} --to {end}")
+        return False
+    db_handler = DatabaseHandler()
+    if filename is None:
+        count = export_range(db_handler, sys.stdout, start, end, category, delimiter)
+    else:
+        with open(filename, "w", newline='', encoding="utf-8") as f_out:
+            count = export_range(db_handler, f_out, start, end, category, delimiter)
+        print(f"Exported {count} expenses to {filename}.")
+    db_handler.close_connection()
+    return True
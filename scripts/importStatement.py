@@ -0,0 +1,198 @@
+import csv
+import hashlib
+import os
+import time
+
+from .database import (
+    CreateBackup,
+    DatabaseHandler
+)
+from .processInput import (
+    PARSE_OK,
+    PARSE_ERROR_NAMES,
+    parse_batch
+)
+
+FIELDS = ["date", "value", "category", "description"]
+DEFAULT_COLUMNS = "date=0,value=1,category=2,description=3"
+
+class ColumnMappingError(ValueError):
+    # The column mapping doesn't fit the options or the file, raised before anything is written
+    pass
+
+def parse_columns(columns: str):
+    """
+    Column mapping like "date=Booking date,value=Amount,description=Text",
+    values being either header names or 0-based column indexes.
+    """
+    mapping = {}
+    for pair in columns.split(','):
+        field, _, column = pair.partition('=')
+        field = field.strip().lower()
+        if field not in FIELDS or not column.strip():
+            raise ColumnMappingError(f"Invalid column mapping '{pair}', expected one of {FIELDS}=<name or index>")
+        column = column.strip()
+        mapping[field] = int(column) if column.isdigit() else column
+    for field in ("date", "value", "description"):
+        if field not in mapping:
+            raise ColumnMappingError(f"Column mapping is missing '{field}'")
+    return mapping
+
+def resolve_columns(mapping: dict, header: list):
+    # Header names -> indexes, so rows can stay plain lists
+    resolved = {}
+    for field, column in mapping.items():
+        if isinstance(column, int):
+            resolved[field] = column
+        elif header is not None and column in header:
+            resolved[field] = header.index(column)
+        else:
+            raise ColumnMappingError(f"Column '{column}' not found in the file header")
+    return resolved
+
+class StatementImporter:
+    """
+    Streams a CSV/bank export into the database: rows are validated chunk by chunk
+    with the same rules as the bot/UI (parse_batch) and written one transaction per chunk.
+    Rejected rows go to a separate CSV file together with their line number and error.
+    Every row is keyed by its cells (see source_key), so importing the same file again
+    only adds the rows not imported yet. A file with another layout gets other keys.
+    Memory is constant except for the occurrence counter of the keys, which holds every
+    distinct row of the file (~85 bytes each, e.g. ~85 MB for a million rows).
+    """
+    def __init__(self, db_handler: DatabaseHandler, columns: str = DEFAULT_COLUMNS, delimiter: str = ',',
+                 header: bool = False, default_category: str = None, chunk_size: int = 1000):
+        self.db_handler = db_handler
+        self.mapping = parse_columns(columns)
+        self.delimiter = delimiter
+        self.header = header
+        self.default_category = default_category
+        self.chunk_size = chunk_size
+        if "category" not in self.mapping and default_category is None:
+            raise ColumnMappingError("No category column mapped: provide a default category")
+
+        self.imported = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.line_number = 0 # Of the last line read, e.g. the one that couldn't be decoded
+        self._seen = {}
+
+    def row_to_message(self, row: list, columns: dict):
+        # ';' is the field separator of the query format, keep it out of the fields themselves
+        fields = {}
+        for field in FIELDS:
+            if field in columns and columns[field] < len(row):
+                fields[field] = row[columns[field]].replace(';', ',')
+            else:
+                fields[field] = ""
+        if not fields["category"] and self.default_category is not None:
+            fields["category"] = self.default_category
+        return f"{fields['date']}; {fields['value']}; {fields['category']}; {fields['description']}"
+
+    def source_key(self, row: list):
+        """
+        "import:<hash of the row>:<n>", n counting the identical rows seen before in
+        this file: two equal transactions of the same day stay two expenses, while the
+        same row imported again from the same file gets the same key.
+        The counter can't be reset along the file (e.g. per date): in a file that isn't
+        ordered, a row counted again from 0 would be taken for an already imported one.
+        """
+        digest = hashlib.blake2b("\x1f".join(row).encode(), digest_size=16).digest()
+        occurrence = self._seen.get(digest, 0) # Raw digests as keys, smaller than their hex form
+        self._seen[digest] = occurrence + 1
+        return f"import:{digest.hex()}:{occurrence}"
+
+    def flush(self, chunk: list, rejects_writer):
+        # Validate the whole chunk at once, then write the valid rows in one transaction
+        if not chunk:
+            return
+        batch = parse_batch(message for _, _, message, _ in chunk)
+        valid_rows = batch.valid_rows()
+        inserted = self.db_handler.add_records([batch.record(idx) for idx in valid_rows],
+                                               [chunk[idx][3] for idx in valid_rows])
+        if inserted is not None:
+            self.imported += inserted
+            self.duplicates += len(valid_rows) - inserted
+        else:
+            for idx in valid_rows:
+                self.reject(rejects_writer, chunk[idx][0], chunk[idx][1], "database")
+        for idx, error in enumerate(batch.errors):
+            if error != PARSE_OK:
+                self.reject(rejects_writer, chunk[idx][0], chunk[idx][1], PARSE_ERROR_NAMES[error])
+        chunk.clear()
+
+    def reject(self, rejects_writer, line_number: int, row: list, reason: str):
+        self.rejected += 1
+        rejects_writer.writerow([line_number, reason] + row)
+
+    def decoded_lines(self, f_in):
+        # UTF-8 (optional BOM) decoded line by line rather than by blocks, so a decoding
+        # error is raised exactly at its line, with every line before it already read
+        for self.line_number, line in enumerate(f_in, 1):
+            yield line.decode("utf-8-sig" if self.line_number == 1 else "utf-8")
+
+    def run(self, filename: str, rejects_filename: str = None):
+        """
+        Import `filename`. Raises ColumnMappingError before writing anything if the mapping
+        doesn't fit the header, and UnicodeDecodeError at the first line that isn't UTF-8
+        (see line_number), the rows before it being imported.
+        """
+        if rejects_filename is None:
+            rejects_filename = os.path.splitext(filename)[0] + ".rejects.csv"
+
+        with open(filename, "rb") as f_in:
+            reader = csv.reader(self.decoded_lines(f_in), delimiter=self.delimiter)
+            header = next(reader, None) if self.header else None
+            columns = resolve_columns(self.mapping, header) # Before creating the rejects file
+
+            try:
+                with open(rejects_filename, "w", newline='', encoding="utf-8") as f_rejects:
+                    rejects_writer = csv.writer(f_rejects, delimiter=self.delimiter)
+                    rejects_writer.writerow(["line", "error"] + (header if header is not None else []))
+
+                    chunk = []
+                    try:
+                        for row in reader:
+                            if not any(cell.strip() for cell in row):
+                                continue # Empty lines are not worth a reject
+                            chunk.append((reader.line_num, row, self.row_to_message(row, columns), self.source_key(row)))
+                            if len(chunk) >= self.chunk_size:
+                                self.flush(chunk, rejects_writer)
+                    finally:
+                        self.flush(chunk, rejects_writer) # The rows read before a decoding error too
+            finally:
+                if self.rejected == 0:
+                    os.remove(rejects_filename)
+        return self.imported, self.rejected
+
+
+def mainImport(filename: str, columns: str = DEFAULT_COLUMNS, delimiter: str = ',', header: bool = False,
+               default_category: str = None):
+    if filename is None or not os.path.isfile(filename):
+        print("Please provide an existing file to import: main.py --method import FILE.csv")
+        return False
+
+    CreateBackup()
+    db_handler = DatabaseHandler()
+    try:
+        # Bad mappings and header names are raised before anything is written
+        importer = StatementImporter(db_handler, columns=columns, delimiter=delimiter, header=header,
+                                     default_category=default_category)
+        start = time.perf_counter()
+        imported, rejected = importer.run(filename)
+    except ColumnMappingError as error:
+        print(f"{error}. Please check --columns (field=<header name or 0-based index>), --header and --default-category")
+        return False
+    except UnicodeDecodeError as error:
+        print(f"Line {importer.line_number} of {filename} isn't valid UTF-8 ({error.reason}): import stopped there, "
+              f"after importing {importer.imported} expenses. Please convert the file to UTF-8 and import it again.")
+        return False
+    finally:
+        db_handler.close_connection()
+
+    print(f"Imported {imported} expenses in {time.perf_counter() - start:.2f}s.")
+    if importer.duplicates:
+        print(f"{importer.duplicates} rows were already imported before and have been skipped.")
+    if rejected:
+        print(f"{rejected} rows couldn't be imported, see {os.path.splitext(filename)[0]}.rejects.csv")
+    return True
@@ -0,0 +1,166 @@
+import atexit
+import bisect
+import functools
+import inspect
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+"""
+Opt-in timing instrumentation. Enabled by setting FINANCES_METRICS to an
+output file: `.json` for JSON, anything else for the Prometheus text format.
+Metrics are dumped there on exit, and on SIGUSR1 where available.
+FINANCES_SLOW_MS additionally logs every call slower than that many ms to stderr.
+
+When FINANCES_METRICS is unset the decorators return the functions unchanged,
+so there is no overhead at all.
+"""
+
+METRICS_FILENAME = os.environ.get("FINANCES_METRICS")
+ENABLED = bool(METRICS_FILENAME)
+
+def _slow_ms(value: str):
+    # A malformed threshold only disables the slow-call log, it must not break the app
+    try:
+        return float(value) or None
+    except ValueError:
+        print(f"Ignoring FINANCES_SLOW_MS={value!r}, expected a number of milliseconds", file=sys.stderr)
+        return None
+
+SLOW_MS = _slow_ms(os.environ.get("FINANCES_SLOW_MS", "0"))
+
+# Upper bounds (ms) of the latency histogram buckets, the last one catches everything
+BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+class Metric:
+    __slots__ = ("count", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0]*len(BUCKETS_MS)
+
+    def observe(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+_metrics = {}
+_lock = threading.RLock() # Reentrant: the SIGUSR1 dump can interrupt observe in the same thread
+
+def observe(name: str, elapsed_ms: float):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Metric()
+        metric.observe(elapsed_ms)
+    if SLOW_MS is not None and elapsed_ms >= SLOW_MS:
+        print(f"[slow] {name} took {elapsed_ms:.1f}ms", file=sys.stderr)
+
+def instrumented(name: str):
+    """
+    Decorator recording count and latency of every call under `name`.
+    Works for plain and async functions, and for generators: the time spent
+    producing the items, summed over the whole iteration, is one call.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                elapsed = 0.0 # Not counting the consumer's time between items
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        yield item
+                finally:
+                    generator.close()
+                    observe(name, elapsed*1000)
+            return generator_wrapper
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    observe(name, (time.perf_counter() - start)*1000)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, (time.perf_counter() - start)*1000)
+        return wrapper
+    return decorator
+
+def instrument_class(cls, prefix: str):
+    # Instrument every public method of `cls` as "<prefix>.<method>"
+    if not ENABLED:
+        return cls
+    for attribute, value in list(vars(cls).items()):
+        if callable(value) and not attribute.startswith('_'):
+            setattr(cls, attribute, instrumented(f"{prefix}.{attribute}")(value))
+    return cls
+
+
+def snapshot():
+    with _lock:
+        return {
+            name: {
+                "count": metric.count,
+                "total_ms": metric.total_ms,
+                "mean_ms": metric.total_ms/metric.count if metric.count else 0.0,
+                "max_ms": metric.max_ms,
+                "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                            for bound, count in zip(BUCKETS_MS, metric.buckets)},
+            }
+            for name, metric in _metrics.items()
+        }
+
+def to_prometheus(metrics: dict):
+    lines = [
+        "# HELP finances_call_duration_ms Latency of instrumented calls in milliseconds.",
+        "# TYPE finances_call_duration_ms histogram",
+    ]
+    for name, metric in sorted(metrics.items()):
+        cumulative = 0
+        for bound, count in metric["buckets"].items():
+            cumulative += count
+            lines.append(f'finances_call_duration_ms_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'finances_call_duration_ms_sum{{name="{name}"}} {metric["total_ms"]}')
+        lines.append(f'finances_call_duration_ms_count{{name="{name}"}} {metric["count"]}')
+    return "\n".join(lines) + "\n"
+
+def dump(filename: str = METRICS_FILENAME):
+    metrics = snapshot()
+    if filename.endswith(".json"):
+        text = json.dumps(metrics, indent=2)
+    else:
+        text = to_prometheus(metrics)
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        f.write(text)
+    os.replace(tmp_filename, filename)
+
+
+if ENABLED:
+    atexit.register(dump)
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter
+
+from .instrumentation import (
+    instrumented,
+)
+
+# Telegram rejects text messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+def coalesce(sections, max_length: int = MAX_MESSAGE_LENGTH):
+    """
+    Pack [(header, [lines])] into as few texts as possible, each at most
+    `max_length` characters. Texts are only split between lines, except for
+    a single line that is too long by itself.
+    """
+    texts = []
+    current = ""
+    for header, lines in sections:
+        if not lines:
+            continue
+        for line in [header] + list(lines):
+            while len(line) > max_length:
+                if current:
+                    texts.append(current)
+                    current = ""
+                texts.append(line[:max_length])
+                line = line[max_length:]
+            candidate = f"{current}\n{line}" if current else line
+            if len(candidate) > max_length:
+                texts.append(current)
+                candidate = line
+            current = candidate
+    if current:
+        texts.append(current)
+    return texts
+
+class TokenBucket:
+    """
+    Allows bursts of `capacity` calls, refilled at `rate` tokens per second.
+    """
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.last = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last)*self.rate)
+        self.last = now
+
+    async def acquire(self):
+        self.refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens)/self.rate)
+            self.refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        # Empty the bucket so the next call is only allowed after `seconds`
+        self.refill()
+        self.tokens = 1 - seconds*self.rate
+
+class MessageSender:
+    """
+    Sends texts and images through a Bot, at most `rate` messages per second (bursts
+    of `burst`). When Telegram answers with "retry after N seconds" the whole sender
+    waits and the message is sent again, up to `max_retries` times.
+    The file_ids of the last `max_photos` images sent are kept, to not upload them twice.
+    """
+    def __init__(self, bot, rate: float = 1.0, burst: int = 3, max_retries: int = 3, max_photos: int = 256):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.max_photos = max_photos
+        self.sent = 0
+        self.retried = 0
+        self.photo_ids = OrderedDict() # Image file -> Telegram file_id, least recently sent first
+
+    @instrumented("telegram.send_message")
+    async def send(self, chat_id, text: str):
+        return await self._send_with_retries(self.bot.send_message, text=text, chat_id=chat_id)
+
+    @instrumented("telegram.send_photo")
+    async def send_photo(self, chat_id, filename: str, caption: str = None):
+        if filename in self.photo_ids:
+            self.photo_ids.move_to_end(filename)
+            return await self._send_with_retries(self.bot.send_photo, photo=self.photo_ids[filename], chat_id=chat_id, caption=caption)
+        with open(filename, "rb") as f:
+            message = await self._send_with_retries(self.bot.send_photo, photo=f.read(), chat_id=chat_id, caption=caption)
+        self.photo_ids[filename] = message.photo[-1].file_id
+        if len(self.photo_ids) > self.max_photos:
+            self.photo_ids.popitem(last=False) # Charts of old generations are never asked for again
+        return message
+
+    async def _send_with_retries(self, send_function, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                message = await send_function(**kwargs)
+                self.sent += 1
+                return message
+            except RetryAfter as error:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = error.retry_after
+                if hasattr(retry_after, "total_seconds"): # timedelta in newer python-telegram-bot versions
+                    retry_after = retry_after.total_seconds()
+                self.retried += 1
+                self.bucket.pause(retry_after)
+
+    async def send_all(self, chat_id, texts):
+        # In order: messages to one chat should arrive as they were written
+        for text in texts:
+            await self.send(chat_id, text)
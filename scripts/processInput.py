@@ -1,12 +1,141 @@
 from datetime import datetime
+from array import array
 import re
 
 from .utils import (
+    CATEGORIES_AVAILABLE,
     DICT_MONTHS_NUMBERTONAME,
     DICT_CATEGORIES_LOWERTONAME,
     DICT_CATEGORIES_NAMETOLOWER,
 )
 
+# Per-row error codes of parse_batch
+PARSE_OK = 0
+PARSE_ERROR_FORMAT = 1
+PARSE_ERROR_DATE = 2
+PARSE_ERROR_VALUE = 3
+PARSE_ERROR_CATEGORY = 4
+PARSE_ERROR_DESCRIPTION = 5
+PARSE_ERROR_NAMES = {
+    PARSE_OK: "ok",
+    PARSE_ERROR_FORMAT: "format",
+    PARSE_ERROR_DATE: "date",
+    PARSE_ERROR_VALUE: "value",
+    PARSE_ERROR_CATEGORY: "category",
+    PARSE_ERROR_DESCRIPTION: "description",
+}
+
+# Largest accepted value of an expense (sum of its terms included), well inside the int64 cents column
+MAX_VALUE_CENTS = 10**12 - 1
+
+# [0-9], not \d: \d also matches the other Unicode digits ("٢٠٢٤"), which are not accepted
+_DATE_PATTERN = re.compile(r"^([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})$")
+_VALUE_PATTERN = re.compile(r"^([0-9]{1,10})(?:\.([0-9]{1,2}))?$")
+_DAYS_IN_MONTH = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+_CATEGORY_IDS = {DICT_CATEGORIES_NAMETOLOWER[name]: idx for idx, name in enumerate(CATEGORIES_AVAILABLE)}
+
+class ParsedBatch:
+    """
+    Columnar result of parse_batch: one entry per input line in each column.
+    Rows with errors[i] != PARSE_OK hold zeros/empty strings in the other columns.
+    """
+    __slots__ = ("days", "months", "years", "cents", "categories", "descriptions", "errors")
+
+    def __init__(self):
+        self.days = array('B')
+        self.months = array('B')
+        self.years = array('H')
+        self.cents = array('q')
+        self.categories = array('b') # Index in CATEGORIES_AVAILABLE, -1 if invalid
+        self.descriptions = []
+        self.errors = array('B')
+
+    def __len__(self):
+        return len(self.errors)
+
+    def valid_rows(self):
+        return [idx for idx, error in enumerate(self.errors) if error == PARSE_OK]
+
+    def record(self, idx: int):
+        # (YYYYMMDD, category, value_cents, description): the typed row stored in the database
+        return (self.years[idx]*10000 + self.months[idx]*100 + self.days[idx],
+                CATEGORIES_AVAILABLE[self.categories[idx]], self.cents[idx], self.descriptions[idx])
+
+    def entry(self, idx: int):
+        # Same fields as UserInputProcessor / DatabaseHandler.add_entry
+        return {
+            "month": DICT_MONTHS_NUMBERTONAME[self.months[idx]],
+            "year": self.years[idx],
+            "day": f"{self.days[idx]:02}",
+            "category": CATEGORIES_AVAILABLE[self.categories[idx]],
+            "value": f"{self.cents[idx]/100:.2f}",
+            "description": self.descriptions[idx],
+        }
+
+def parse_batch(lines):
+    """
+    Batch counterpart of UserInputProcessor, with the same validation rules.
+    Takes any iterable of "DD/MM/YYYY; VALUE; CATEGORY; DESCRIPTION" lines and
+    returns a ParsedBatch, with no object created per line.
+    """
+    batch = ParsedBatch()
+    days, months, years = batch.days, batch.months, batch.years
+    cents, categories, descriptions, errors = batch.cents, batch.categories, batch.descriptions, batch.errors
+    date_match = _DATE_PATTERN.match
+    value_match = _VALUE_PATTERN.match
+    category_ids = _CATEGORY_IDS
+    days_in_month = _DAYS_IN_MONTH
+
+    for line in lines:
+        error = PARSE_OK
+        day = month = year = total = 0
+        category = -1
+        description = ""
+
+        fields = line.split(';')
+        if len(fields) != 4:
+            error = PARSE_ERROR_FORMAT
+        else:
+            match = date_match(fields[0].strip())
+            if match is None:
+                error = PARSE_ERROR_DATE
+            else:
+                day, month, year = int(match[1]), int(match[2]), int(match[3])
+                leap_day = month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+                if not (1 <= month <= 12 and 1 <= day <= days_in_month[month] + leap_day and year >= 1):
+                    error = PARSE_ERROR_DATE
+            if error == PARSE_OK:
+                for term in fields[1].split('+'):
+                    match = value_match(term.strip())
+                    if match is None:
+                        error = PARSE_ERROR_VALUE
+                        break
+                    decimals = match[2]
+                    total += int(match[1])*100 + (int(decimals.ljust(2, '0')) if decimals else 0)
+                if total > MAX_VALUE_CENTS:
+                    error = PARSE_ERROR_VALUE
+            if error == PARSE_OK:
+                category = category_ids.get(fields[2].strip().lower().replace(' ', ''), -1)
+                if category < 0:
+                    error = PARSE_ERROR_CATEGORY
+            if error == PARSE_OK:
+                description = fields[3].strip()
+                if not description:
+                    error = PARSE_ERROR_DESCRIPTION
+
+        if error != PARSE_OK:
+            day = month = year = total = 0
+            category = -1
+            description = ""
+        days.append(day)
+        months.append(month)
+        years.append(year)
+        cents.append(total)
+        categories.append(category)
+        descriptions.append(description)
+        errors.append(error)
+    return batch
+
 class UserInputProcessor:
     def __init__(self, message: str, debug: bool=False):
         """
@@ -54,6 +183,8 @@ class UserInputProcessor:
                 
     def processDate(self, dateString: str):
         try:
+            if not dateString.isascii():
+                raise ValueError(dateString) # strptime would take other Unicode digits in the year
             date = datetime.strptime(dateString, "%d/%m/%Y") 
             self.day = f"{date.day:02}" #Number with two digits
             self.month = DICT_MONTHS_NUMBERTONAME[date.month]
@@ -66,16 +197,18 @@ class UserInputProcessor:
                 
     def processValue(self, valueString: str):
         """
-        Value should be integer or float of at most 2 decimal places.
+        Value should be integer or float of at most 2 decimal places, at most MAX_VALUE_CENTS in total.
         We accept addition operation e.g. "2 + 4.50"
         """
         values = [value.strip() for value in valueString.split('+')]
         
         validValues = True
-        value_pattern = r"^\d+(\.\d{1,2})?$"
+        value_pattern = r"^[0-9]{1,10}(\.[0-9]{1,2})?$"
         for value in values:
             if not re.match(value_pattern, value):
                 validValues = False
+        if validValues and round(sum(float(v) for v in values)*100) > MAX_VALUE_CENTS:
+            validValues = False
         if validValues:
             self.value = f"{sum([float(v) for v in values]):.2f}" 
         else:
@@ -0,0 +1,57 @@
+from .utils import (
+    CATEGORIES_AVAILABLE,
+)
+
+"""
+Compact in-memory expenses for the UI tables. Rows are kept as stored
+(YYYYMMDD date, integer cents) and only turned into strings when a view
+paints them; sorting reorders a list of row indexes by precomputed
+integer keys instead of comparing the records themselves.
+"""
+
+_CATEGORY_RANK = {category: rank for rank, category in enumerate(CATEGORIES_AVAILABLE)}
+
+class ExpenseRecord:
+    """
+    One expense. `category_key` sorts by category, in the CATEGORIES_AVAILABLE
+    order (unknown categories last), then by date.
+    """
+    __slots__ = ("id", "date", "category", "value_cents", "description", "category_key")
+
+    def __init__(self, expense_id: int, date: int, category: str, value_cents: int, description: str):
+        self.id = expense_id
+        self.date = date
+        self.category = category
+        self.value_cents = value_cents
+        self.description = description
+        self.category_key = _CATEGORY_RANK.get(category, len(CATEGORIES_AVAILABLE))*100000000 + date
+
+    def day(self):
+        return f"{self.date % 100:02}"
+
+    def full_date(self):
+        return f"{self.date // 10000}-{self.date // 100 % 100:02}-{self.date % 100:02}"
+
+    def value(self):
+        return f"{self.value_cents/100:.2f}"
+
+def records_from_rows(rows):
+    # (id, YYYYMMDD, category, value_cents, description) rows, e.g. from DatabaseHandler.iter_range or search.
+    # Dates, categories and category keys repeat a lot: every record shares one object per distinct value.
+    shared = {}
+    records = []
+    for expense_id, date, category, value_cents, description in rows:
+        record = ExpenseRecord(expense_id, shared.setdefault(date, date), shared.setdefault(category, category),
+                               value_cents, description)
+        record.category_key = shared.setdefault(record.category_key, record.category_key)
+        records.append(record)
+    return records
+
+def sorted_order(records: list, order: list, key: str, reverse: bool = False):
+    """
+    `order` (indexes into `records`) sorted by the `key` attribute of the records.
+    The keys are read once, then only integers are compared; the sort is stable.
+    """
+    keys = [getattr(records[i], key) for i in order]
+    positions = sorted(range(len(order)), key=keys.__getitem__, reverse=reverse)
+    return [order[position] for position in positions]
@@ -0,0 +1,150 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from .utils import (
+    FONT,
+    CATEGORIES_AVAILABLE,
+    MONTHS,
+    DICT_MONTHS_NAMETONUMBER,
+)
+from .database import (
+    DatabaseHandler,
+)
+from .charts import (
+    CategoryBarChart,
+)
+from .report import (
+    build_report,
+)
+
+"""
+Offscreen rendering of the summary charts of the UI into PNG files, with
+the Agg backend only (no Qt). Images are cached next to the database under
+a name made of the chart parameters and the write generation of the
+ledger, so a chart is only drawn again once the expenses have changed.
+Many charts can be rendered in parallel with render_charts.
+"""
+
+# "month": totals of one month, as in the date window.
+# "average": mean ± std of the monthly totals before the month, as in the main window.
+CHART_KINDS = ["month", "average"]
+FIGURE_SIZE = (6, 4)
+DPI = 100
+
+def cache_dir(db_file: str):
+    return os.path.splitext(db_file)[0] + ".charts"
+
+def chart_filename(db_file: str, kind: str, month: str, year, generation):
+    # The cache key: every parameter of the chart plus the ledger generation
+    return os.path.join(cache_dir(db_file),
+                        f"{kind}_{int(year)}-{DICT_MONTHS_NAMETONUMBER[month]:02}_{FIGURE_SIZE[0]}x{FIGURE_SIZE[1]}@{DPI}_g{generation}.png")
+
+def chart_data(db_handler: DatabaseHandler, kind: str, month: str, year):
+    # (values, stds, title) of a chart, values being None when there is nothing to show
+    if kind == "month":
+        totals = db_handler.get_totals_period(month, str(year))
+        if not totals:
+            return None, None, ""
+        values = [totals.get(category, 0.0) for category in CATEGORIES_AVAILABLE]
+        return values, None, "Total: {:.2f}€".format(sum(values))
+    report = build_report(db_handler, None, date(int(year), DICT_MONTHS_NAMETONUMBER[month], 1))
+    if not report["summary"]:
+        return None, None, ""
+    means = [report["summary"][category]["mean_month"] for category in CATEGORIES_AVAILABLE]
+    stds = [report["summary"][category]["std_month"] for category in CATEGORIES_AVAILABLE]
+    month_label = MONTHS[DICT_MONTHS_NAMETONUMBER[month]-2] # The month before, the last one averaged
+    year_label = int(year) if month_label != "December" else int(year)-1
+    return means, stds, f"Average of expenses until {month_label} {year_label}"+" [Total: {:.2f}€]".format(sum(means))
+
+def draw_png(filename: str, kind: str, values, stds, title: str):
+    with matplotlib.rc_context({"font.family": FONT, "font.size": 9}):
+        figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        figure.set_tight_layout(True)
+        canvas = FigureCanvasAgg(figure)
+        chart = CategoryBarChart(figure, with_errors=kind == "average", hide_yaxis=kind == "month")
+        chart.update(values, stds, title=title)
+        tmp_filename = filename + ".tmp.png"
+        canvas.print_png(tmp_filename)
+    os.replace(tmp_filename, filename) # Readers never see a half-written image
+
+def _remove_stale(filename: str):
+    # Older generations of the same chart will never be served again
+    directory = os.path.dirname(filename)
+    prefix = os.path.basename(filename).rsplit("_g", 1)[0] + "_g"
+    for file in os.listdir(directory):
+        if file.startswith(prefix) and file.endswith(".png") and file != os.path.basename(filename):
+            try:
+                os.remove(os.path.join(directory, file))
+            except FileNotFoundError:
+                pass # Removed by a concurrent render
+
+def render_chart(db_handler: DatabaseHandler, kind: str, month: str, year):
+    """
+    PNG of a summary chart, drawn only if the cache has no image for the current
+    generation of the ledger. Returns (filename, cached).
+    """
+    if kind not in CHART_KINDS:
+        raise ValueError(f"Unknown chart '{kind}', expected one of {CHART_KINDS}")
+    filename = chart_filename(db_handler.db_file, kind, month, year, db_handler.get_generation())
+    if os.path.isfile(filename):
+        return filename, True
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    draw_png(filename, kind, *chart_data(db_handler, kind, month, year))
+    _remove_stale(filename)
+    return filename, False
+
+_process_handlers = {}
+
+def _render_in_process(db_file: str, kind: str, month: str, year):
+    # Pool entry point: one handler per worker process, reused across its tasks
+    if db_file not in _process_handlers:
+        _process_handlers[db_file] = DatabaseHandler(db_file)
+    return render_chart(_process_handlers[db_file], kind, month, year)
+
+def render_charts(db_file: str, charts, max_workers: int = None):
+    """
+    Render many (kind, month, year) charts in parallel processes, e.g. every month
+    of a year. Returns the (filename, cached) of each chart, in order.
+    """
+    charts = list(charts)
+    if len(charts) <= 1:
+        return [_render_in_process(db_file, *chart) for chart in charts]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_render_in_process, db_file, *chart) for chart in charts]
+        return [future.result() for future in futures]
+
+def mainCharts(start: str = None, end: str = None, max_workers: int = None):
+    # Render both charts of every month of [start, end), by default every month with expenses
+    try:
+        start_date = None if start is None else date.fromisoformat(start)
+        end_date = None if end is None else date.fromisoformat(end)
+    except ValueError:
+        print(f"Please provide valid dates (YYYY-MM-DD), got --from {start} --to {end}")
+        return False
+    db_handler = DatabaseHandler()
+    monthly = db_handler.get_monthly_totals_range()
+    db_handler.close_connection()
+    if not monthly:
+        print("There are no expenses to draw.")
+        return True
+    # (year, month) of the first month drawn and of the first one after the range
+    first = (monthly[0][0] // 100, monthly[0][0] % 100) if start_date is None else (start_date.year, start_date.month)
+    if end_date is None:
+        last = (monthly[-1][0] // 100, monthly[-1][0] % 100 + 1)
+    else:
+        last = (end_date.year, end_date.month + (end_date.day > 1))
+    last = (last[0] + 1, 1) if last[1] > 12 else last
+    charts = []
+    year, month = first
+    while (year, month) < last:
+        charts += [(kind, MONTHS[month-1], year) for kind in CHART_KINDS]
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    results = render_charts(db_handler.db_file, charts, max_workers)
+    print(f"{len(results)} charts in {cache_dir(db_handler.db_file)} ({sum(not cached for _, cached in results)} drawn, "
+          f"{sum(cached for _, cached in results)} already cached).")
+    return True
@@ -0,0 +1,160 @@
+import csv
+import json
+import math
+import sys
+from datetime import date
+
+from .utils import (
+    CATEGORIES_AVAILABLE,
+    iter_periods,
+    next_period,
+)
+from .database import (
+    DatabaseHandler
+)
+
+"""
+Headless reports: totals per month, year or category over a date range,
+with the monthly mean and standard deviation per category (as the summary
+plot of the UI). Only aggregate queries are run (see
+DatabaseHandler.get_monthly_totals_range) and nothing graphical is imported,
+so a report is cheap enough for cron jobs and dashboards.
+"""
+
+GROUPINGS = ["month", "year", "category"]
+FORMATS = ["table", "json", "csv"]
+
+def _period_label(period: int) -> str:
+    return f"{period // 100}-{period % 100:02}"
+
+def _mean_std(values: list):
+    # Population std, like numpy's default used by the UI summary
+    if not values:
+        return 0.0, 0.0
+    mean = sum(values)/len(values)
+    return mean, math.sqrt(max(sum(v*v for v in values)/len(values) - mean*mean, 0.0))
+
+def build_report(db_handler: DatabaseHandler, start: date = None, end: date = None, by: str = "month",
+                 category: str = None):
+    """
+    Report over the expenses in [start, end) (None: unbounded) as a dict:
+    one row of per-category totals per month/year, or one row per category,
+    plus per-category total, count and monthly mean/std. Amounts in euros.
+    The months of the statistics go from the first month with expenses (or
+    `start`) to the last one (or the month before `end`), empty months included.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping '{by}', expected one of {GROUPINGS}")
+    categories = [category] if category is not None else list(CATEGORIES_AVAILABLE)
+    monthly = db_handler.get_monthly_totals_range(start, end, category)
+
+    report = {
+        "from": None if start is None else start.isoformat(),
+        "to": None if end is None else end.isoformat(),
+        "by": by,
+        "categories": categories,
+        "rows": [],
+        "summary": {},
+    }
+    if not monthly:
+        return report
+    first_period = monthly[0][0] if start is None else start.year*100 + start.month
+    if end is None:
+        end_period = next_period(monthly[-1][0])
+    else:
+        end_period = end.year*100 + end.month if end.day == 1 else next_period(end.year*100 + end.month)
+    periods = list(iter_periods(first_period, end_period))
+
+    totals = {(period, name): 0 for period in periods for name in categories} # Cents
+    counts = {name: 0 for name in categories}
+    for period, name, total_cents, count in monthly:
+        if name not in counts: # Category no longer available, still counted in the totals
+            categories.append(name)
+            counts[name] = 0
+            totals.update({(p, name): 0 for p in periods})
+        totals[(period, name)] += total_cents
+        counts[name] += count
+
+    groups = {}
+    for period in periods:
+        key = _period_label(period) if by == "month" else str(period // 100)
+        group = groups.setdefault(key, {name: 0 for name in categories})
+        for name in categories:
+            group[name] += totals[(period, name)]
+
+    for name in categories:
+        mean, std = _mean_std([totals[(period, name)]/100 for period in periods])
+        report["summary"][name] = {
+            "total": sum(totals[(period, name)] for period in periods)/100,
+            "count": counts[name],
+            "mean_month": mean,
+            "std_month": std,
+        }
+    if by == "category":
+        report["rows"] = [{"category": name, **report["summary"][name]} for name in categories]
+    else:
+        report["rows"] = [
+            {by: key, "totals": {name: cents/100 for name, cents in group.items()}, "total": sum(group.values())/100}
+            for key, group in groups.items()
+        ]
+    report["total"] = sum(summary["total"] for summary in report["summary"].values())
+    return report
+
+def _table_rows(report: dict):
+    # Header + rows of cells, shared by the table and CSV outputs
+    categories = report["categories"]
+    if report["by"] == "category":
+        header = ["category", "total", "count", "mean_month", "std_month"]
+        rows = [[row["category"], f"{row['total']:.2f}", str(row["count"]), f"{row['mean_month']:.2f}",
+                 f"{row['std_month']:.2f}"] for row in report["rows"]]
+        return header, rows
+    header = [report["by"]] + categories + ["total"]
+    rows = [[row[report["by"]]] + [f"{row['totals'][name]:.2f}" for name in categories] + [f"{row['total']:.2f}"]
+            for row in report["rows"]]
+    if report["rows"]:
+        summary = report["summary"]
+        rows.append(["mean_month"] + [f"{summary[name]['mean_month']:.2f}" for name in categories] +
+                    [f"{sum(s['mean_month'] for s in summary.values()):.2f}"])
+        rows.append(["std_month"] + [f"{summary[name]['std_month']:.2f}" for name in categories] + [""])
+    return header, rows
+
+def write_report(report: dict, f_out, output_format: str = "table"):
+    if output_format == "json":
+        json.dump(report, f_out, indent=1)
+        f_out.write("\n")
+        return
+    header, rows = _table_rows(report)
+    if output_format == "csv":
+        writer = csv.writer(f_out)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return
+    if not rows:
+        f_out.write("No expenses in the selected range.\n")
+        return
+    widths = [max(len(line[column]) for line in [header] + rows) for column in range(len(header))]
+    for line in [header] + rows:
+        # First column left-aligned, amounts right-aligned
+        cells = [line[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(line[1:], widths[1:])]
+        f_out.write("  ".join(cells).rstrip() + "\n")
+
+def mainReport(filename: str = None, start: str = None, end: str = None, by: str = "month", category: str = None,
+               output_format: str = "table"):
+    if by not in GROUPINGS or output_format not in FORMATS:
+        print(f"Please provide a valid grouping ({', '.join(GROUPINGS)}) and format ({', '.join(FORMATS)})")
+        return False
+    try:
+        start_date = None if start is None else date.fromisoformat(start)
+        end_date = None if end is None else date.fromisoformat(end)
+    except ValueError:
+        print(f"Please provide valid dates (YYYY-MM-DD), got --from {start} --to {end}")
+        return False
+    db_handler = DatabaseHandler()
+    report = build_report(db_handler, start_date, end_date, by=by, category=category)
+    db_handler.close_connection()
+    if filename is None:
+        write_report(report, sys.stdout, output_format)
+    else:
+        with open(filename, "w", newline='', encoding="utf-8") as f_out:
+            write_report(report, f_out, output_format)
+    return True
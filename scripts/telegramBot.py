@@ -1,128 +1,303 @@
 import os
+import re
+import time
 import asyncio
 from telegram import Bot
+from telegram.error import NetworkError, TimedOut
 
 from .utils import (
-    API_TELEGRAM_BOT,
-    MAIN_DIR
+    API_TELEGRAM_BASE_URL,
+    get_api_telegram_bot,
+    MAIN_DIR,
+    MONTHS
 )
 from .database import (
     CreateBackup,
     DatabaseHandler
 )
+from .instrumentation import (
+    instrumented,
+)
+from .messageSender import (
+    MessageSender,
+    coalesce
+)
 from .processInput import (
-    UserInputProcessor
+    PARSE_OK,
+    parse_batch
 )
 
+def write_atomic(filename: str, content: str):
+    # Write to a temporary file and rename it, so a crash never leaves a half-written file
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+# Expense ids of "DELETE <id>": ASCII digits only (str.isdigit also takes "²"), within SQLite's 64-bit integers
+_ID_PATTERN = re.compile(r"[0-9]{1,18}")
+
+def strip_bot_mention(text: str):
+    # "/summary@MyBot 03" -> "/summary 03": in groups, commands are addressed to a bot by name
+    return re.sub(r"^(/\w+)@\w+", r"\1", text)
+
+def parse_summary_request(text: str):
+    """
+    "/summary [month [year]]" -> (month name, year), the month given by name or
+    number, by default the current one. None if the request can't be understood.
+    """
+    args = text[len("/summary"):].split()
+    month, year = MONTHS[int(time.strftime("%m"))-1], time.strftime("%Y")
+    if len(args) > 2:
+        return None
+    if args:
+        names = {name.lower(): name for name in MONTHS}
+        if args[0].lower() in names:
+            month = names[args[0].lower()]
+        elif args[0].isdigit() and 1 <= int(args[0]) <= 12:
+            month = MONTHS[int(args[0])-1]
+        else:
+            return None
+    if len(args) == 2:
+        if not (args[1].isdigit() and len(args[1]) == 4):
+            return None
+        year = args[1]
+    return month, year
+
 class TelegramBot:
     def __init__(self):
         self.db_handler = DatabaseHandler()
-        self.bot = Bot(API_TELEGRAM_BOT)
+        self.bot = Bot(get_api_telegram_bot(), base_url=API_TELEGRAM_BASE_URL)
+        self.sender = MessageSender(self.bot)
 
         self.last_update_timestamp_filename = os.path.join(MAIN_DIR, ".last_update_timestamp_bot")
+        self.update_offset_filename = os.path.join(MAIN_DIR, ".update_offset_bot")
         self.get_last_update_timestamp()
+        self.get_update_offset()
         self.chat_id = None
         
     def get_last_update_timestamp(self):
+        # Only used until the first update offset is saved, to not re-ingest old messages
         if os.path.isfile(self.last_update_timestamp_filename):
            with open(self.last_update_timestamp_filename, "r") as f:
                self.last_update_timestamp = float(f.readlines()[0].strip()) 
         else:
             self.last_update_timestamp = 0
 
-    def save_last_update_timestamp(self, update_timestamp: float):
-        with open(self.last_update_timestamp_filename, "w") as f:
-            f.write(str(update_timestamp))
+    def get_update_offset(self):
+        if os.path.isfile(self.update_offset_filename):
+            with open(self.update_offset_filename, "r") as f:
+                self.update_offset = int(f.readlines()[0].strip())
+        else:
+            self.update_offset = None
+
+    def save_update_offset(self, update_offset: int):
+        # getUpdates with this offset also confirms every older update to Telegram
+        write_atomic(self.update_offset_filename, str(update_offset))
+        self.update_offset = update_offset
 
-    async def processMessages(self):
-        new_entries = [m for m in self.messages if "DELETE" not in m]
-        del_entries = [m for m in self.messages if "DELETE" in m]        
+    def processMessages(self):
+        ## Write the expenses added/deleted by self.messages, each kind in a single transaction, and
+        ## return what is left to answer: send_replies doesn't write, so the offset is saved in between.
+        commands = ("/find", "/summary")
+        find_queries = [m[len("/find"):].strip() for m in self.messages if m.startswith("/find")]
+        summary_requests = [m for m in self.messages if m.startswith("/summary")]
+        new_entries = [m for m in self.messages if "DELETE" not in m and not m.startswith(commands)]
+        new_keys = [k for m, k in zip(self.messages, self.message_keys) if "DELETE" not in m and not m.startswith(commands)]
+        del_entries = [m for m in self.messages if "DELETE" in m and not m.startswith(commands)]
 
         success_new_entries = []
         fail_new_entries = []
         success_del_entries = []
         fail_del_entries = []
         
-        for message in new_entries:
-            info = UserInputProcessor(message)
-            if info.isValid:
-                self.db_handler.add_entry(
-                    month=info.month, 
-                    year=info.year,
-                    day=info.day, 
-                    category=info.category, 
-                    value=info.value, 
-                    description=info.description,
-                )
-                success_new_entries.append(message)
+        ## Parse everything first, then write each kind of entry in a single transaction.
+        ## Messages keyed by an update already ingested (e.g. redelivered after a crash) are skipped by the database.
+        batch = parse_batch(new_entries)
+        valid_rows = batch.valid_rows()
+        inserted = self.db_handler.add_records([batch.record(idx) for idx in valid_rows], [new_keys[idx] for idx in valid_rows])
+        if inserted is not None and inserted < len(valid_rows):
+            print(f"{len(valid_rows) - inserted} messages were already in the database")
+        valid_rows = set(valid_rows) if inserted is not None else set()
+        ## The ids in the replies are what "DELETE <id>" expects (redelivered messages get the id of their first insert)
+        ids = self.db_handler.get_ids_by_source_key(new_keys[idx] for idx in valid_rows)
+        for idx, message in enumerate(new_entries):
+            if idx in valid_rows:
+                success_new_entries.append(f"#{ids[new_keys[idx]]} {message}")
             else:
                 fail_new_entries.append(message)
         
-        for message in del_entries:
-            message = message.replace("DELETE", "")
-            info = UserInputProcessor(message)
-            if info.isValid:
-                success = self.db_handler.delete_entry(
-                                month=info.month, 
-                                year=info.year,
-                                day=info.day, 
-                                category=info.category, 
-                                value=info.value, 
-                                description=info.description,
-                            )
-                if success:
-                    success_del_entries.append(message)
-                else:
-                    fail_del_entries.append(message)
+        ## "DELETE <id>" removes exactly that expense, "DELETE <full query>" one expense matching it
+        del_entries = [message.replace("DELETE", "") for message in del_entries]
+        batch = parse_batch(del_entries)
+        valid_del_entries = []
+        valid_del_items = []
+        for idx, message in enumerate(del_entries):
+            if _ID_PATTERN.fullmatch(message.strip()):
+                valid_del_entries.append(message)
+                valid_del_items.append({"id": int(message)})
+            elif batch.errors[idx] == PARSE_OK:
+                valid_del_entries.append(message)
+                valid_del_items.append(batch.entry(idx))
+            else:
+                fail_del_entries.append(message)
+        results = self.db_handler.delete_entries(valid_del_items)
+        for message, success in zip(valid_del_entries, results):
+            if success:
+                success_del_entries.append(message)
             else:
                 fail_del_entries.append(message)
+
+        return {
+            "sections": [
+                ("THE FOLLOWING EXPENSES WERE ADDED: ", success_new_entries),
+                ("COULDN'T ADD THE FOLLOWING EXPENSES: ", fail_new_entries),
+                ("THE FOLLOWING EXPENSES WERE DELETED: ", success_del_entries),
+                ("COULDN'T DELETE THE FOLLOWING EXPENSES: ", fail_del_entries),
+            ],
+            "find_queries": find_queries,
+            "summary_requests": summary_requests,
+        }
+
+    def processMessagesOneByOne(self):
+        ## Fallback when processMessages raised for the whole batch: every message alone, so one bad
+        ## message can't block the others. Replaying is safe, adds are keyed by update and a failed
+        ## batch of DELETEs was rolled back. Messages that still fail are logged, answered and dropped.
+        messages, message_keys = self.messages, self.message_keys
+        replies = None
+        failed = []
+        for message, key in zip(messages, message_keys):
+            self.messages, self.message_keys = [message], [key]
+            try:
+                single = self.processMessages()
+            except Exception as error:
+                print(f"Couldn't process update {key} ({type(error).__name__}: {error}): {message!r}")
+                failed.append(message)
+                continue
+            if replies is None:
+                replies = single
+            else:
+                for (_, lines), (_, single_lines) in zip(replies["sections"], single["sections"]):
+                    lines.extend(single_lines)
+                replies["find_queries"] += single["find_queries"]
+                replies["summary_requests"] += single["summary_requests"]
+        self.messages, self.message_keys = messages, message_keys
+        if replies is None:
+            replies = {"sections": [], "find_queries": [], "summary_requests": []}
+        replies["sections"].append(("COULDN'T PROCESS THE FOLLOWING MESSAGES: ", failed))
+        return replies
+
+    async def send_replies(self, replies):
+        ## "/find <text>" searches the descriptions, after the writes so the results are up to date
+        find_sections = []
+        for text in replies["find_queries"]:
+            results = self.db_handler.search(text) if text else []
+            lines = [
+                f"#{expense_id} {date % 100:02}/{date // 100 % 100:02}/{date // 10000} {value_cents/100:.2f} {category} {description}"
+                for expense_id, date, category, value_cents, description in results
+            ]
+            find_sections.append((f"RESULTS FOR '{text}': ", lines or ["No expenses found"]))
+
+        ## "/summary [month year]": the charts of the UI as images, drawn only if the expenses changed since the last time
+        charts = []
+        fail_summaries = []
+        for message in replies["summary_requests"]:
+            request = parse_summary_request(message)
+            if request is None:
+                fail_summaries.append(message)
+                continue
+            from .rendering import render_chart # matplotlib is only loaded once a chart is asked for
+            for kind in ("month", "average"):
+                filename, _ = await asyncio.to_thread(render_chart, self.db_handler, kind, *request)
+                charts.append((filename, f"{request[0]} {request[1]}" if kind == "month" else None))
                     
-        if success_new_entries:
-            await self.bot.send_message(text="THE FOLLOWING EXPENSES WERE ADDED: ", chat_id=self.chat_id)
-            for message in success_new_entries:
-                await self.bot.send_message(text=message, chat_id=self.chat_id)
-        if fail_new_entries:
-            await self.bot.send_message(text="COULDN'T ADD THE FOLLOWING EXPENSES: ", chat_id=self.chat_id)
-            for message in fail_new_entries:
-                await self.bot.send_message(text=message, chat_id=self.chat_id)
-        if success_del_entries:
-            await self.bot.send_message(text="THE FOLLOWING EXPENSES WERE DELETED: ", chat_id=self.chat_id)
-            for message in success_del_entries:
-                await self.bot.send_message(text=message, chat_id=self.chat_id)
-        if fail_del_entries:
-            await self.bot.send_message(text="COULDN'T DELETE THE FOLLOWING EXPENSES: ", chat_id=self.chat_id)
-            for message in fail_del_entries:
-                await self.bot.send_message(text=message, chat_id=self.chat_id)
+        ## All the replies coalesced in as few messages as possible, sent through the rate limiter
+        texts = coalesce([
+            *replies["sections"],
+            *find_sections,
+            ("COULDN'T UNDERSTAND THE FOLLOWING SUMMARY REQUESTS (use /summary [month [year]]): ", fail_summaries),
+        ])
+        await self.sender.send_all(self.chat_id, texts)
+        for filename, caption in charts:
+            await self.sender.send_photo(self.chat_id, filename, caption=caption)
         
-    async def get_updates(self):
-        ## Fetch updates asynchronously.
+    @instrumented("telegram.get_updates")
+    async def get_updates(self, timeout: int = 0):
+        ## Fetch the updates after the saved offset. With timeout > 0 this is a long poll:
+        ## Telegram holds the request open until a message arrives or the timeout expires.
         self.updates = []
-        updates = await self.bot.getUpdates()    
+        updates = await self.bot.get_updates(offset=self.update_offset, timeout=timeout, read_timeout=timeout + 10)
         for update in updates:
-            #message = update.message.text
-            timestamp = update.message.date.timestamp()
-            if timestamp > self.last_update_timestamp:
-                self.updates.append(update)
-            
+            if update.message is None or update.message.text is None:
+                continue # Edits, stickers, ... there is nothing to process
+            if self.update_offset is None and update.message.date.timestamp() <= self.last_update_timestamp:
+                continue # Already processed before offsets were used
+            self.updates.append(update)
+        return updates
         
-    async def run(self):
-        ## Asynchronous run logic.
-        await self.get_updates()
+    @instrumented("telegram.process_updates")
+    async def process_updates(self, updates):
+        ## Process the messages kept by get_updates, then persist the progress once for the whole
+        ## batch (`updates` is the raw batch, including the updates that were skipped). The offset
+        ## is saved as soon as the writes are committed: a failure while answering must not make
+        ## the next poll apply the same DELETEs again. It is also saved past messages that can't be
+        ## processed at all, which would otherwise be fetched again and again.
         self.messages = []
+        self.message_keys = []
         for update in self.updates:        
-            self.save_last_update_timestamp(update.message.date.timestamp())
-            self.messages.append(update.message.text)
+            self.messages.append(strip_bot_mention(update.message.text))
+            self.message_keys.append(f"telegram:{update.update_id}")
             self.chat_id = update.message.chat.id
         if self.messages:
             print("The following messages will be processed: ")
             for message in self.messages:
                 print(message)
-            await self.processMessages()
-        else:
+            try:
+                replies = self.processMessages()
+            except Exception as error:
+                print(f"Couldn't process the batch ({type(error).__name__}: {error}), retrying message by message")
+                replies = self.processMessagesOneByOne()
+        if updates:
+            self.save_update_offset(updates[-1].update_id + 1)
+        if self.messages:
+            await self.send_replies(replies)
+        return len(self.messages)
+
+    async def run(self):
+        ## Asynchronous run logic: a single pass, as done by cron.
+        updates = await self.get_updates()
+        if not await self.process_updates(updates):
             print("There are no new messages...")
+
+    async def run_forever(self, poll_timeout: int = 30, retry_delay: float = 5):
+        ## Daemon mode: long poll in a loop, keeping the same bot session and database connection.
+        async with self.bot:
+            while True:
+                try:
+                    updates = await self.get_updates(timeout=poll_timeout)
+                except (NetworkError, TimedOut) as error:
+                    print(f"Couldn't fetch updates ({error}), retrying in {retry_delay}s")
+                    await asyncio.sleep(retry_delay)
+                    continue
+                try:
+                    await self.process_updates(updates)
+                except Exception as error:
+                    # E.g. a reply that still can't be sent after the retries: log it and keep serving
+                    print(f"Couldn't process updates ({type(error).__name__}: {error}), retrying in {retry_delay}s")
+                    await asyncio.sleep(retry_delay)
              
 
 async def mainBot():
     CreateBackup()
     bot = TelegramBot()
-    await bot.run()    
\ No newline at end of file
+    await bot.run()    
+
+async def mainBotDaemon():
+    CreateBackup()
+    bot = TelegramBot()
+    try:
+        await bot.run_forever()
+    finally:
+        bot.db_handler.close_connection()
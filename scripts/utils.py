@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 
 
 MAIN_DIR = os.path.join(os.path.dirname(__file__), '../')
@@ -12,16 +13,44 @@ DICT_CATEGORIES_NAMETOLOWER = {
 DICT_CATEGORIES_LOWERTONAME = {
     lower:name for name,lower in DICT_CATEGORIES_NAMETOLOWER.items()
 }
-YEARS = [str(y) for y in range(2024, 2031)]
 MONTHS = [
     "January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December",
 ]
 DICT_MONTHS_NAMETONUMBER = {name:number+1 for number,name in enumerate(MONTHS)}
 DICT_MONTHS_NUMBERTONAME = {number+1:name for number,name in enumerate(MONTHS)}
 
-with open(os.path.join(MAIN_DIR, ".tokenTelegram"), "r") as f:
-    API_TELEGRAM_BOT = f.readlines()[0].strip()
+def next_period(period: int) -> int:
+    # YYYYMM period of the month after `period`
+    return period + 1 if period % 100 < 12 else (period // 100 + 1)*100 + 1
+
+def iter_periods(first_period: int, end_period: int):
+    # YYYYMM periods from first_period until (excluding) end_period
+    period = first_period
+    while period < end_period:
+        yield period
+        period = next_period(period)
+
+TOKEN_TELEGRAM_FILENAME = os.path.join(MAIN_DIR, ".tokenTelegram")
+
+@lru_cache(maxsize=None)
+def get_api_telegram_bot():
+    # Read on first use only, so everything but the bot works without a token file
+    if not os.path.isfile(TOKEN_TELEGRAM_FILENAME):
+        raise FileNotFoundError(f"Telegram bot token not found: save it in {TOKEN_TELEGRAM_FILENAME}")
+    with open(TOKEN_TELEGRAM_FILENAME, "r") as f:
+        return f.readlines()[0].strip()
+
+# Can point to a local fake Bot API server, e.g. to exercise the rate limiter
+API_TELEGRAM_BASE_URL = os.environ.get("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")
     
 DB_FILENAME = os.path.join(MAIN_DIR, "MyExpenses.db")
 
+# SQLite connection tuning: how long a writer waits for another process' lock, and the page cache per connection
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+
+# Backup retention: the last BACKUP_KEEP_DAILY backups, plus one per month for the last BACKUP_KEEP_MONTHLY months
+BACKUP_KEEP_DAILY = 7
+BACKUP_KEEP_MONTHLY = 12
+
 FONT = "PT Mono"
\ No newline at end of file
@@ -0,0 +1,124 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from .utils import (
+    CATEGORIES_AVAILABLE,
+    DICT_MONTHS_NAMETONUMBER,
+)
+from .analytics import (
+    LedgerColumns,
+)
+from .database import (
+    DatabaseHandler,
+)
+from .records import (
+    records_from_rows,
+)
+
+"""
+Background database work for the UI. Queries and aggregations run on a
+small thread pool, each pool thread with its own sqlite3 connection
+(see database.ConnectionPool), and results come back to the GUI thread
+through Qt signals.
+"""
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+def shared_db_handler(db_file: str):
+    # One handler per database, shared by the pool threads: each thread gets its own connection from the handler's pool
+    with _handlers_lock:
+        if db_file not in _handlers:
+            _handlers[db_file] = DatabaseHandler(db_file)
+        return _handlers[db_file]
+
+_pool = None
+
+def query_pool():
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+        _pool.setMaxThreadCount(2)
+        _pool.setExpiryTimeout(-1) # Keep the threads, and so their connections, alive
+    return _pool
+
+
+def records_period(db_handler: DatabaseHandler, month: str, year: str):
+    # ExpenseRecords of one month sorted by date, built here so the GUI thread only receives the list
+    start = int(year)*10000 + DICT_MONTHS_NAMETONUMBER[month]*100
+    return records_from_rows(db_handler.iter_range(start, start + 100))
+
+def summary_date(db_handler: DatabaseHandler, month: str, year: str):
+    # {category: total} of one month, None if there are no expenses
+    totals = db_handler.get_totals_period(month, year)
+    if not totals:
+        return None
+    return {category: totals.get(category, 0.0) for category in CATEGORIES_AVAILABLE}
+
+_ledger_columns = {}
+
+def shared_ledger_columns(db_handler: DatabaseHandler):
+    # One LedgerColumns per database for all the pool threads: it serializes the updates of its files
+    with _handlers_lock:
+        if db_handler.db_file not in _ledger_columns:
+            _ledger_columns[db_handler.db_file] = LedgerColumns(db_handler)
+        return _ledger_columns[db_handler.db_file]
+
+def summary_all_months(db_handler: DatabaseHandler, month: str, year: str):
+    # (mean, std) per category over the months before month/year, None if there are none.
+    # Vectorized over the memory-mapped columns, refreshed with just the new rows.
+    columns = shared_ledger_columns(db_handler)
+    columns.refresh()
+    return columns.mean_std_until(DICT_MONTHS_NAMETONUMBER[month], int(year))
+
+
+class _QuerySignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class _QueryRunnable(QRunnable):
+    def __init__(self, request_id: int, db_file: str, function, args, signals: _QuerySignals):
+        super().__init__()
+        self.request_id = request_id
+        self.db_file = db_file
+        self.function = function
+        self.args = args
+        self.signals = signals
+
+    def run(self):
+        try:
+            result = self.function(shared_db_handler(self.db_file), *self.args)
+        except Exception as error:
+            self.signals.failed.emit(self.request_id, str(error))
+            return
+        self.signals.finished.emit(self.request_id, result)
+
+class QueryWorker(QObject):
+    """
+    Runs `function(db_handler, *args)` on the query pool and emits resultReady
+    with its return value. Only the most recent request is delivered: results
+    of requests superseded in the meantime are dropped.
+    """
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, db_file: str, parent=None):
+        super().__init__(parent)
+        self.db_file = db_file
+        self.latest_request = 0
+        self.signals = _QuerySignals(self) # Lives in the GUI thread, so emits from the pool are queued
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+
+    def submit(self, function, *args):
+        self.latest_request += 1
+        query_pool().start(_QueryRunnable(self.latest_request, self.db_file, function, args, self.signals))
+        return self.latest_request
+
+    def _on_finished(self, request_id: int, result):
+        if request_id == self.latest_request:
+            self.resultReady.emit(result)
+
+    def _on_failed(self, request_id: int, message: str):
+        if request_id == self.latest_request:
+            print(f"Background query failed: {message}")
@@ -0,0 +1,74 @@
+import random
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from scripts.analytics import LedgerColumns
+from scripts.database import DatabaseHandler
+from scripts.utils import CATEGORIES_AVAILABLE
+
+
+def random_records(rng, n):
+    return [(rng.randint(2024, 2025)*10000 + rng.randint(1, 12)*100 + rng.randint(1, 28),
+             rng.choice(CATEGORIES_AVAILABLE), rng.randint(1, 50000), "expense") for _ in range(n)]
+
+
+def sql_totals(db_handler):
+    totals = {name: 0.0 for name in CATEGORIES_AVAILABLE}
+    for category, cents in db_handler.cursor.execute('SELECT category, SUM(value_cents) FROM expenses GROUP BY category'):
+        totals[category] = cents/100
+    return totals
+
+
+def test_concurrent_refresh_and_append(tmp_path):
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    rng = random.Random(0)
+    db_handler.add_records(random_records(rng, 2000))
+    columns = LedgerColumns(db_handler)
+    columns.refresh()
+
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        # Appends most of the time, and deletes now and then to force rebuilds
+        try:
+            for i in range(60):
+                db_handler.add_records(random_records(rng, 200))
+                if i % 10 == 0:
+                    db_handler.cursor.execute('DELETE FROM expenses WHERE id IN (SELECT id FROM expenses ORDER BY random() LIMIT 50)')
+                    db_handler.conn.commit()
+                columns.refresh()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            done.set()
+
+    def reader():
+        try:
+            while not done.is_set():
+                columns.refresh()
+                result = columns.mean_std_until(1, 2026)
+                assert result is not None
+                assert len(columns.days) == len(columns.cents) == len(columns.categories)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    columns.refresh()
+    expected = sql_totals(db_handler)
+    totals = columns.range_totals(20240101, 20260101)
+    for name in CATEGORIES_AVAILABLE:
+        assert totals[name] == pytest.approx(expected[name])
+    assert len(columns.ids) == db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+    # A second instance over the same cache reads the files the shared one left
+    assert LedgerColumns(db_handler).range_totals(20240101, 20260101) == totals
+    db_handler.close_connection()
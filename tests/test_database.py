@@ -0,0 +1,57 @@
+from scripts.database import DatabaseHandler
+
+
+def test_search_ranks_every_match(tmp_path):
+    # The best match is the oldest expense, behind more than `candidates` newer weak matches
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    db_handler.add_records([(20200101, "Food", 1000, "pizza pizza")])
+    db_handler.add_records([(20240101 + i % 28, "Food", 500, f"pizza with friends after the match {i}")
+                            for i in range(300)])
+    best = db_handler.search("pizza", limit=1, candidates=100)
+    assert [row[1:] for row in best] == [(20200101, "Food", 1000, "pizza pizza")]
+    assert len(db_handler.search("pizza", limit=500)) == 301
+
+
+def test_delete_entries_rolls_back_the_batch(tmp_path):
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    db_handler.add_records([(20240301, "Food", 100, "kept"), (20240302, "Food", 200, "locked"),
+                            (20240303, "Food", 300, "kept")])
+    ids = [row[0] for row in db_handler.cursor.execute('SELECT id FROM expenses ORDER BY id')]
+    # The second delete fails inside the transaction, after the first one succeeded
+    db_handler.cursor.execute('''CREATE TRIGGER refuse_delete BEFORE DELETE ON expenses WHEN old.description = 'locked'
+                              BEGIN SELECT RAISE(ABORT, 'locked expense'); END''')
+    results = db_handler.delete_entries(iter([{"id": expense_id} for expense_id in ids]))
+    assert results == [False, False, False]
+    assert db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (3,)
+
+
+def test_add_entries_rolls_back_the_batch(tmp_path):
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    db_handler.cursor.execute('''CREATE TRIGGER refuse_insert BEFORE INSERT ON expenses WHEN new.description = 'locked'
+                              BEGIN SELECT RAISE(ABORT, 'locked expense'); END''')
+    entries = [dict(month="March", year="2024", day="01", category="Food", value="1.00", description=description)
+               for description in ("kept", "locked", "kept")]
+    assert db_handler.add_entries(iter(entries + [{"month": "March"}])) == [False, False, False, False]
+    assert db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (0,)
+
+
+def test_get_ids_by_source_key(tmp_path):
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    records = [(20240301 + i % 28, "Food", 100 + i, f"expense {i}") for i in range(1200)]
+    keys = [f"telegram:{i}" for i in range(1200)]
+    assert db_handler.add_records(records, keys) == 1200
+    # Keys already in the database are skipped, and still resolve to the id of their first insert
+    assert db_handler.add_records(records[:10], keys[:10]) == 0
+    ids = db_handler.get_ids_by_source_key(keys + ["telegram:missing"])
+    assert len(ids) == 1200
+    rows = dict(db_handler.cursor.execute('SELECT id, description FROM expenses').fetchall())
+    assert all(rows[ids[key]] == f"expense {i}" for i, key in enumerate(keys))
+
+
+def test_delete_entries_reports_bad_entries_without_raising(tmp_path):
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    db_handler.add_records([(20240301, "Food", 100, "first"), (20240302, "Food", 200, "second")])
+    first, second = [row[0] for row in db_handler.cursor.execute('SELECT id FROM expenses ORDER BY id')]
+    results = db_handler.delete_entries([{"id": first}, {"id": 10**20}, {"id": "²"}, {"month": "March"}, {"id": second}])
+    assert results == [True, False, False, False, True]
+    assert db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (0,)
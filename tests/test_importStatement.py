@@ -0,0 +1,37 @@
+import pytest
+
+from scripts.database import DatabaseHandler
+from scripts.importStatement import (
+    ColumnMappingError,
+    StatementImporter,
+)
+
+
+def write_statement(path, lines, tail=b""):
+    path.write_bytes("\n".join(lines).encode() + b"\n" + tail)
+    return str(path)
+
+
+def test_missing_header_column_writes_nothing(tmp_path):
+    filename = write_statement(tmp_path / "statement.csv", ["Date,Amount,Text", "05/03/2024,1.50,coffee"])
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    importer = StatementImporter(db_handler, columns="date=Date,value=Amount,description=Nope", header=True,
+                                 default_category="Food")
+    with pytest.raises(ColumnMappingError):
+        importer.run(filename)
+    assert not (tmp_path / "statement.rejects.csv").exists()
+    assert db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (0,)
+
+
+def test_decoding_error_stops_at_its_line(tmp_path):
+    lines = [f"0{day}/03/2024,1.50,Food,expense {day}" for day in range(1, 6)]
+    filename = write_statement(tmp_path / "statement.csv", lines, tail="06/03/2024,2,Food,caf\xe9\n".encode("latin-1"))
+    db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    importer = StatementImporter(db_handler, chunk_size=2)
+    with pytest.raises(UnicodeDecodeError):
+        importer.run(filename)
+    # Every line before the undecodable one is imported, and nothing is left to reject
+    assert importer.line_number == 6
+    assert importer.imported == 5
+    assert db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (5,)
+    assert not (tmp_path / "statement.rejects.csv").exists()
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import RetryAfter
+
+import scripts.messageSender as messageSender
+from scripts.messageSender import (
+    MessageSender,
+    TokenBucket,
+    coalesce,
+)
+
+
+class FakeClock:
+    # time.monotonic stand-in, advanced by the patched asyncio.sleep instead of waiting
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(messageSender.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_coalesce_packs_and_splits():
+    assert coalesce([("A:", ["a1", "a2"]), ("B:", []), ("C:", ["c1"])]) == ["A:\na1\na2\nC:\nc1"]
+    texts = coalesce([("H", ["x"*4, "y"*4, "z"*4])], max_length=10)
+    assert texts == ["H\nxxxx", "yyyy\nzzzz"] # Split between lines only
+    assert coalesce([("H", ["w"*25])], max_length=10) == ["H", "w"*10, "w"*10, "w"*5]
+    assert all(len(text) <= 10 for text in texts)
+
+
+def test_token_bucket_limits_the_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock)
+
+    async def acquire_all(n):
+        times = []
+        for _ in range(n):
+            await bucket.acquire()
+            times.append(clock.now)
+        return times
+    times = asyncio.run(acquire_all(7))
+    assert times[:3] == [0.0, 0.0, 0.0] # The burst
+    assert times[3:] == pytest.approx([0.5, 1.0, 1.5, 2.0]) # Then `rate` per second
+
+    bucket.pause(5)
+    asyncio.run(acquire_all(1))
+    assert clock.now == pytest.approx(7.0)
+
+
+class FlakyBot:
+    # Answers "retry after" to the first `failures` calls
+    def __init__(self, failures):
+        self.failures = failures
+        self.texts = []
+
+    async def send_message(self, text, chat_id):
+        if self.failures:
+            self.failures -= 1
+            raise RetryAfter(3)
+        self.texts.append(text)
+        return text
+
+
+def test_sender_waits_and_retries_after_flood_control(clock):
+    bot = FlakyBot(failures=2)
+    sender = MessageSender(bot, rate=1.0, burst=3, max_retries=3)
+    sender.bucket = TokenBucket(1.0, 3, clock=clock)
+    asyncio.run(sender.send_all(1, ["first", "second"]))
+    assert bot.texts == ["first", "second"]
+    assert (sender.sent, sender.retried) == (2, 2)
+    assert clock.now >= 6 # Two waits of 3 seconds
+
+
+def test_sender_gives_up_after_max_retries(clock):
+    sender = MessageSender(FlakyBot(failures=5), max_retries=2)
+    sender.bucket = TokenBucket(1.0, 3, clock=clock)
+    with pytest.raises(RetryAfter):
+        asyncio.run(sender.send(1, "never"))
+    assert (sender.sent, sender.retried) == (0, 2)
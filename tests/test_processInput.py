@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from scripts.processInput import (
+    MAX_VALUE_CENTS,
+    PARSE_ERROR_VALUE,
+    PARSE_OK,
+    UserInputProcessor,
+    parse_batch,
+)
+
+DATES = ["05/03/2024", "5/3/2024", "29/02/2024", "29/02/2023", "31/04/2024", "00/01/2024", "01/13/2024",
+         "01/01/0000", "01/01/24", "2024-03-05", "٠٥/٠٣/٢٠٢٤", "05/03/٢٠٢٤", "０５/03/2024", ""]
+VALUES = ["1", "1.5", "12.34", "1.234", "0", "2 + 4.50", "3+", ".5", "1,5", "-1", "١.٥", "１２", "7+٣", "",
+          "9999999999.99", "9999999999.99+0.01", "10000000000", "99999999999999999999"]
+CATEGORIES = ["Food", "food", "FOOD", "To myself", "tomyself", "Nope", ""]
+DESCRIPTIONS = ["coffee", "  lunch with friends ", "café", "", " "]
+
+
+def random_message(rng):
+    fields = [rng.choice(DATES), rng.choice(VALUES), rng.choice(CATEGORIES), rng.choice(DESCRIPTIONS)]
+    if rng.random() < 0.05:
+        fields.append("extra")
+    return ";".join(fields)
+
+
+def processor_entry(processor):
+    return {
+        "month": processor.month,
+        "year": processor.year,
+        "day": processor.day,
+        "category": processor.category,
+        "value": processor.value,
+        "description": processor.description,
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parse_batch_matches_user_input_processor(seed):
+    rng = random.Random(seed)
+    messages = [random_message(rng) for _ in range(2000)]
+    batch = parse_batch(messages)
+    for idx, message in enumerate(messages):
+        processor = UserInputProcessor(message)
+        assert (batch.errors[idx] == PARSE_OK) == processor.isValid, message
+        if processor.isValid:
+            assert batch.entry(idx) == processor_entry(processor), message
+
+
+def test_only_ascii_digits_are_accepted():
+    for message in ["٠٥/٠٣/٢٠٢٤;1.5;Food;a", "05/03/٢٠٢٤;1.5;Food;a", "05/03/2024;١.٥;Food;a", "05/03/2024;１２;Food;a"]:
+        assert parse_batch([message]).errors[0] != PARSE_OK
+        assert not UserInputProcessor(message).isValid
+
+
+def test_oversized_values_are_rejected():
+    assert MAX_VALUE_CENTS == 999999999999
+    assert parse_batch(["05/03/2024;9999999999.99;Food;x"]).cents[0] == MAX_VALUE_CENTS
+    for value in ["99999999999999999999", "10000000000", "9999999999.99+0.01", "+".join(["9999999999"]*1000)]:
+        message = f"05/03/2024;{value};Food;x"
+        batch = parse_batch([message, "05/03/2024;1.5;Food;ok"])
+        assert list(batch.errors) == [PARSE_ERROR_VALUE, PARSE_OK]
+        assert not UserInputProcessor(message).isValid
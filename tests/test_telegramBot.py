@@ -0,0 +1,72 @@
+import asyncio
+import types
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("telegram")
+
+import scripts.telegramBot as telegramBot
+from scripts.database import DatabaseHandler
+
+
+class RecordingSender:
+    def __init__(self):
+        self.texts = []
+
+    async def send_all(self, chat_id, texts):
+        self.texts += texts
+
+    async def send_photo(self, chat_id, filename, caption=None):
+        pass
+
+
+def make_bot(tmp_path):
+    # A TelegramBot without network nor token, writing to a temporary ledger
+    bot = telegramBot.TelegramBot.__new__(telegramBot.TelegramBot)
+    bot.db_handler = DatabaseHandler(str(tmp_path / "ledger.db"))
+    bot.sender = RecordingSender()
+    bot.update_offset_filename = str(tmp_path / "offset")
+    bot.update_offset = None
+    bot.last_update_timestamp = 0
+    bot.chat_id = None
+    return bot
+
+
+def make_updates(texts, first_id=1):
+    return [types.SimpleNamespace(update_id=first_id + i, message=types.SimpleNamespace(
+        text=text, chat=types.SimpleNamespace(id=1), date=datetime.now())) for i, text in enumerate(texts)]
+
+
+def test_offset_moves_past_a_message_that_raises(tmp_path, monkeypatch):
+    parse_batch = telegramBot.parse_batch
+
+    def failing_parse_batch(lines):
+        lines = list(lines)
+        if any("boom" in line for line in lines):
+            raise RuntimeError("parser bug")
+        return parse_batch(lines)
+    monkeypatch.setattr(telegramBot, "parse_batch", failing_parse_batch)
+
+    bot = make_bot(tmp_path)
+    updates = make_updates(["05/03/2024;1.5;Food;first", "05/03/2024;2;Food;boom", "06/03/2024;3;Food;last"])
+    bot.updates = updates
+    asyncio.run(bot.process_updates(updates))
+
+    assert bot.update_offset == 4
+    assert bot.db_handler.cursor.execute('SELECT description FROM expenses ORDER BY id').fetchall() == [("first",), ("last",)]
+    replies = "\n".join(bot.sender.texts)
+    assert "COULDN'T PROCESS THE FOLLOWING MESSAGES: \n05/03/2024;2;Food;boom" in replies
+    assert "#1 05/03/2024;1.5;Food;first" in replies and "#2 06/03/2024;3;Food;last" in replies
+
+
+def test_bad_delete_ids_are_answered(tmp_path):
+    bot = make_bot(tmp_path)
+    updates = make_updates(["05/03/2024;1.5;Food;kept", "DELETE ²", "DELETE 99999999999999999999", "DELETE 1"])
+    bot.updates = updates
+    asyncio.run(bot.process_updates(updates))
+
+    assert bot.update_offset == 5
+    assert bot.db_handler.cursor.execute('SELECT COUNT(*) FROM expenses').fetchone() == (0,)
+    replies = "\n".join(bot.sender.texts)
+    assert "COULDN'T DELETE THE FOLLOWING EXPENSES: \n ²\n 99999999999999999999" in replies